@@ -0,0 +1,142 @@
+"""
+asyncio versions of the Messenger classes, built on async_transport.py and
+async_rdt_protocol.py.
+
+AsyncMessenger has the same send/receive/finish interface as Messenger, as
+coroutines, and supports the same compression and batching options.
+Clients make one with `await AsyncClientMessenger.connect(...)`.
+
+AsyncServerMessenger serves many clients at once from a single event loop.
+Each client gets its own session, with its own RDT FSM and AsyncMessenger,
+and is handed to a `handler` coroutine that runs as its own task:
+
+    async def echo(m: AsyncMessenger):
+        while (data := await m.receive()) != b"FINMSG":
+            await m.send(data)
+
+    server = await AsyncServerMessenger.start('udp', 'localhost', lambda: AsyncRDTFactory.create('2.2', 0, 1, 0), echo)
+    await server.serve_forever()
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+from messenger import Messenger
+from async_transport import *
+from async_rdt_protocol import *
+
+
+class AsyncMessenger(Messenger):
+    """A Messenger for a single async transport. Create with AsyncClientMessenger or AsyncServerMessenger"""
+
+    def __init__(self, client_server: str, sock_type: str, ip: str, rdt: RDTProtocolStrategy,
+                 transport: AsyncGenericSocket, **kwargs):
+        super().__init__(client_server, sock_type, ip, rdt, **kwargs)
+        self.transport = transport
+
+    async def send(self, data: bytes):
+        """Break the data up into packets and then send via the RDT protocol"""
+        if self._hold_for_batch(data):
+            if self._batch_due():
+                await self.flush()
+            return
+
+        # keep messages in order by sending anything batched first
+        await self.flush()
+        await self._send_message(data)
+
+    async def flush(self):
+        """Send any messages being held back for batching"""
+        batch = self._take_batch()
+        if batch is not None:
+            await self._send_message(*batch)
+
+    async def receive(self) -> bytes:
+        """Use our RDT protocol to receive data"""
+        await self.flush()
+        if self._received:
+            return self._received.popleft()
+
+        header, payload = await self.rdt.recv_fsm(self.transport)
+        return self._deliver(payload, header["flags"])
+
+    async def _send_message(self, data: bytes, flags: int = 0x00):
+        """Send one (possibly batched) message via the RDT protocol"""
+        payload, flags = self._encode(data, flags)
+        await self.rdt.send_fsm(self.transport, payload, flags)
+
+    async def send_text(self, text: str, encoding: str = 'utf-8'):
+        """Convenience wrapper around send for text messages"""
+        await self.send(text.encode(encoding))
+
+    async def receive_text(self, encoding: str = 'utf-8') -> str:
+        """Convenience wrapper around receive for text messages"""
+        return (await self.receive()).decode(encoding, errors='replace')
+
+    async def finish(self):
+        """Terminate a connection"""
+        await self.flush()
+        # sent raw, as the receive FSMs look for it before any decoding
+        await self.rdt.send_fsm(self.transport, b"FINMSG")
+        self.transport.close()
+
+
+class AsyncClientMessenger(AsyncMessenger):
+    @classmethod
+    async def connect(cls, sock_type: str, ip: str, rdt: RDTProtocolStrategy, **kwargs) -> 'AsyncClientMessenger':
+        transport = await AsyncSocketFactory.new_socket('client', sock_type)(ip, kwargs.get('socket_options'))
+        return cls('client', sock_type, ip, rdt, transport, **kwargs)
+
+
+class AsyncServerMessenger():
+    """
+    Accepts clients on one port and runs `handler` on an AsyncMessenger for each,
+    all on the one event loop. `rdt_factory` is called to make each session's RDT
+    strategy, and any other keyword arguments are passed to each AsyncMessenger
+    """
+
+    def __init__(self, sock_type: str, ip: str, rdt_factory: Callable[[], RDTProtocolStrategy],
+                 handler: Callable[[AsyncMessenger], Awaitable[None]], **kwargs):
+        self.sock_type = sock_type
+        self.ip = ip
+        self.rdt_factory = rdt_factory
+        self.handler = handler
+        self.messenger_kwargs = kwargs
+        self.listener = None
+        self.sessions: set[asyncio.Task] = set()
+
+    @classmethod
+    async def start(cls, sock_type: str, ip: str, rdt_factory: Callable[[], RDTProtocolStrategy],
+                    handler: Callable[[AsyncMessenger], Awaitable[None]], **kwargs) -> 'AsyncServerMessenger':
+        """Create a server and bind its listening socket"""
+        self = cls(sock_type, ip, rdt_factory, handler, **kwargs)
+        self.listener = await AsyncSocketFactory.new_socket('server', sock_type)(ip, kwargs.get('socket_options'))
+        return self
+
+    async def serve_forever(self):
+        """Accept clients until cancelled, running the handler for each as a separate task"""
+        try:
+            while True:
+                transport = await self.listener.accept()
+                m = AsyncMessenger('server', self.sock_type, self.ip, self.rdt_factory(), transport, **self.messenger_kwargs)
+                task = asyncio.create_task(self._run_session(m))
+                self.sessions.add(task)
+                task.add_done_callback(self.sessions.discard)
+        finally:
+            self.close()
+
+    async def _run_session(self, m: AsyncMessenger):
+        try:
+            await self.handler(m)
+        except ClosedSocketError:
+            # the client went away, there's nothing left to do for this session
+            pass
+        finally:
+            if not m.transport.closed:
+                m.transport.close()
+
+    def close(self):
+        """Stop accepting clients and cancel any running sessions"""
+        for task in list(self.sessions):
+            task.cancel()
+        self.listener.close()
@@ -0,0 +1,223 @@
+"""
+asyncio versions of the RDT protocol FSMs, for use with the sockets in
+async_transport.py. Each class extends the blocking version of the same RDT
+version, reusing its packet and header handling, and replaces send_fsm and
+recv_fsm with coroutines. The packets on the wire are identical, so an async
+peer can talk to a blocking one.
+
+Waiting for an ACK yields to the event loop rather than blocking, and the
+RDT 3.0 timeout is done with asyncio.wait_for instead of select.
+"""
+
+import asyncio
+from random import randint
+from typing import Union
+
+import rdt_protocol
+import rdt_functionality
+from rdt_protocol import *
+from async_transport import AsyncGenericSocket
+
+
+class AsyncRDTFactory():
+    """Get the async management class corresponding to a particular RDT version"""
+    @staticmethod
+    def create(rdt_ver: str, error_prob: float, error_num: int, burst: int) -> RDTProtocolStrategy:
+        if rdt_ver == '1.0':
+            return AsyncRDTProtocol_v1(error_prob, error_num, burst)
+        elif rdt_ver == '2.0':
+            return AsyncRDTProtocol_v2_0(error_prob, error_num, burst)
+        elif rdt_ver == '2.1':
+            return AsyncRDTProtocol_v2_1(error_prob, error_num, burst)
+        elif rdt_ver == '2.2':
+            return AsyncRDTProtocol_v2_2(error_prob, error_num, burst)
+        elif rdt_ver == '3.0':
+            return AsyncRDTProtocol_v3(error_prob, error_num, burst)
+        else:
+            raise ValueError("Invalid RDT version")
+
+
+class AsyncRDTProtocol_v1(RDTProtocol_v1):
+    async def send_fsm(self, socket: AsyncGenericSocket, data: bytes, flags: int = 0x00):
+        for packet in self._split_data_into_packets(data, flags):
+            await socket.send(packet)
+
+    async def recv_fsm(self, socket: AsyncGenericSocket) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
+        while True:
+            header, data = self._extract(await socket.receive())
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, bytes(data)
+            if tracker is None:
+                tracker = ReceiveTracker(header["total"], self.PACKET_DATA_LEN)
+            tracker.add(header, data)
+            if tracker.complete():
+                return tracker.message()
+
+
+class AsyncRDTProtocol_v2_0(RDTProtocol_v2_0):
+    async def send_fsm(self, socket: AsyncGenericSocket, data: bytes, flags: int = 0x00):
+        for packet in self._split_data_into_packets(data, flags):
+
+            if data == b"FINMSG":
+                await socket.send(packet)
+                return
+            await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+
+            # wait for ACK, re-sending on NACK
+            while True:
+                header, _ = self._extract(await socket.receive())
+                if header["flags"] & self.FLAGS["ACK"]:
+                    break
+                if header["flags"] & self.FLAGS["NACK"]:
+                    await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+
+    async def recv_fsm(self, socket: AsyncGenericSocket) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
+
+        # read at call time so it can be toggled on the blocking module
+        reject_first_time_flag = rdt_protocol.REJECT_FIRST_TIME_FLAG
+
+        while True:
+            header, data = self._extract(await socket.receive())
+
+            # checking FINMSG, which isn't ACKed as the sender doesn't wait for one
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, bytes(data)
+
+            checksum_valid = not reject_first_time_flag and \
+                not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            reject_first_time_flag = False
+
+            # because this is RDT2.0, we make the assumption that the ACK is not affected by corruption
+            if not checksum_valid:
+                header["flags"] = self.FLAGS["NACK"]
+                await socket.send(self._create_header(header).encode())
+                continue
+
+            if tracker is None:
+                tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN)
+            tracker.add(header.copy(), data)
+            header["flags"] = self.FLAGS["ACK"]
+            await socket.send(self._create_header(header).encode())
+            if tracker.complete():
+                return tracker.message()
+
+
+class AsyncRDTProtocol_v2_1(RDTProtocol_v2_1):
+    async def send_fsm(self, socket: AsyncGenericSocket, data: bytes, flags: int = 0x00):
+        for packet in self._split_data_into_packets(data, flags):
+
+            # always send close messages without corrupting them
+            if data == b"FINMSG":
+                await socket.send(packet)
+                return
+            await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+
+            # wait for ACK, re-sending on NAK or a garbled reply
+            while True:
+                _, reply = self._extract(await socket.receive())
+                if reply == b"ACK":
+                    break
+                await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+
+    def _ack(self, recvSeqNum: int) -> bytes:
+        """The ACK sent for a packet with sequence number `recvSeqNum`"""
+        return self._split_data_into_packets(b"ACK")[0]
+
+    def _nak(self, recvSeqNum: int) -> bytes:
+        """The reply sent for a corrupt packet while waiting for `recvSeqNum`"""
+        return self._split_data_into_packets(b"NAK")[0]
+
+    async def _simulate_delay(self):
+        """Hook for versions that simulate a delay before replying"""
+        pass
+
+    async def recv_fsm(self, socket: AsyncGenericSocket) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
+
+        recvSeqNum = 0      # receiver sequence number
+        while True:
+            header, data = self._extract(await socket.receive())
+
+            # checking FINMSG, which is always sent as a one packet message
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, bytes(data)
+
+            if tracker is None:
+                tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN)
+
+            await self._simulate_delay()
+            checksum_valid = not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            if not checksum_valid:
+                reply = self._nak(recvSeqNum)
+
+            elif int(header["pkt_num"]) == recvSeqNum:
+                tracker.add(header, data)
+                reply = self._ack(recvSeqNum)
+                recvSeqNum = recvSeqNum ^ 1
+
+                # must send uncorrupted ACK on last message received; Two Generals Problem
+                if tracker.complete():
+                    await socket.send(reply)
+                    return tracker.message()
+
+            # wrong sequence number, need to re-send ACK
+            else:
+                reply = self._ack(recvSeqNum ^ 1)
+
+            await socket.send(rdt_functionality.corruptPkt(reply, self.error_num, self.error_prob, self.burst))
+
+
+class AsyncRDTProtocol_v2_2(RDTProtocol_v2_2, AsyncRDTProtocol_v2_1):
+
+    """How long to wait for an ACK before re-sending, None waits forever"""
+    ACK_TIMEOUT: Union[None, float] = None
+
+    async def send_fsm(self, socket: AsyncGenericSocket, data: bytes, flags: int = 0x00):
+        for i, packet in enumerate(self._split_data_into_packets(data, flags)):
+
+            # Don't wait for an ACK on a FINMSG, as we have the two generals problem
+            if data == b"FINMSG":
+                await socket.send(packet)
+                return
+            await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+            sndrSeqNum = i % 2
+
+            # wait for an ACK for this packet number, re-sending on anything else
+            loop = asyncio.get_running_loop()
+            deadline = None if self.ACK_TIMEOUT is None else loop.time() + self.ACK_TIMEOUT
+            while True:
+                receipt = await socket.receive_or_timeout(None if deadline is None else max(0, deadline - loop.time()))
+                if receipt is not None:
+                    header, reply = self._extract(receipt)
+                    if (int(header["pkt_num"]) == sndrSeqNum) and (reply == b"ACK"):
+                        break
+                    if deadline is not None:
+                        # with a timer running, a duplicate or garbled ACK is ignored and
+                        # re-sending is left to the timeout, so duplicates don't multiply
+                        continue
+                await socket.send(rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst))
+                if deadline is not None:
+                    deadline = loop.time() + self.ACK_TIMEOUT
+
+    def _ack(self, recvSeqNum: int) -> bytes:
+        return self._split_data_into_packets(b"ACK", pkt_num_start=recvSeqNum)[0]
+
+    def _nak(self, recvSeqNum: int) -> bytes:
+        # RDT2.2 has no NAK, it re-sends the ACK for the previous packet
+        return self._ack(recvSeqNum ^ 1)
+
+    recv_fsm = AsyncRDTProtocol_v2_1.recv_fsm
+
+
+class AsyncRDTProtocol_v3(RDTProtocol_v3, AsyncRDTProtocol_v2_2):
+
+    ACK_TIMEOUT = RDTProtocolStrategy.RECV_TIMEOUT
+
+    async def _simulate_delay(self):
+        # simulates random delay (not jitter because messages will not arrive out of order)
+        await asyncio.sleep(randint(*self.SIMULATED_DELAY))
+
+    send_fsm = AsyncRDTProtocol_v2_2.send_fsm
+    recv_fsm = AsyncRDTProtocol_v2_1.recv_fsm
@@ -0,0 +1,284 @@
+"""
+asyncio versions of the Socket classes, so that many connections can be
+served from one event loop instead of blocking a thread (or process) each.
+The API mirrors transport.py, except that send and receive are coroutines:
+    - AsyncUDPSocket, AsyncTCPSocket: client side, made with `await cls.connect(addr, options)`
+    - AsyncServerUDPSocket, AsyncServerTCPSocket: server side, made with
+      `await cls.bind(addr, options)`. `await accept()` returns a socket per client
+
+As in transport.py, `options` is a SocketOptions giving the port and the
+socket tuning. The options are set on the socket asyncio makes, once it has made
+it, except for SO_REUSEPORT, which has to be asked for when a server binds.
+
+The server UDP socket demultiplexes datagrams by the sender's address, so each
+client gets its own AsyncUDPSession with its own queue of received datagrams.
+
+TCP is a byte stream, so back-to-back packets can arrive merged or split. The
+async TCP sockets put a length prefix before each packet and read back whole
+packets, so one receive() always returns exactly one packet. This is the same
+framing as TCPSocket in transport.py.
+
+AsyncGenericSocket is an abstract class, and shouldn't be used directly by the user
+"""
+
+import asyncio
+import socket
+import struct
+from typing import Union
+
+from transport import GenericSocket, TCPSocket, SocketOptions, ClosedSocketError
+
+
+class AsyncGenericSocket():
+    """Generic asyncio socket. Child classes implement send and receive"""
+
+    """Default port for server to use, client will attempt to connect to this"""
+    DEFAULT_PORT = GenericSocket.DEFAULT_PORT
+    """Size of the default buffer to hold received data"""
+    BUFFLEN = GenericSocket.BUFFLEN
+
+    def __init__(self):
+        self.closed = False
+
+    async def send(self, data: bytes):
+        raise NotImplementedError()
+
+    async def receive(self) -> bytes:
+        raise NotImplementedError()
+
+    async def receive_or_timeout(self, timeout: Union[None, float]) -> Union[None, bytes]:
+        """Receive data, or return None if nothing arrives within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.receive(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        """Close a socket"""
+        if self.closed:
+            raise ClosedSocketError()
+        self.closed = True
+
+
+class _QueuedDatagramSocket(AsyncGenericSocket):
+    """
+    A socket whose received datagrams are put on a queue by the event loop.
+    Waiting on a queue can be cancelled (eg by a timeout) without losing data
+    """
+    def __init__(self):
+        super().__init__()
+        self.queue: asyncio.Queue[Union[None, bytes]] = asyncio.Queue()
+
+    def _datagram_received(self, data: Union[None, bytes]):
+        """Called by the datagram protocol. None means the underlying socket has closed"""
+        self.queue.put_nowait(data)
+
+    async def receive(self) -> bytes:
+        if self.closed:
+            raise ClosedSocketError()
+        data = await self.queue.get()
+        if data is None:
+            self.closed = True
+            raise ClosedSocketError()
+        return data
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Hands each datagram received by the event loop to a callback"""
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr):
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc: Exception):
+        # eg ICMP port unreachable from a peer that has gone away. The RDT layer
+        # treats this like a lost packet, so there's nothing to do here
+        pass
+
+
+class AsyncUDPSocket(_QueuedDatagramSocket):
+    """Client side UDP socket"""
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__()
+        self.options = SocketOptions() if options is None else options
+        self.binding = (addr, self.options.port)
+        self.endpoint: Union[None, asyncio.DatagramTransport] = None
+
+    @classmethod
+    async def connect(cls, addr: str, options: Union[None, SocketOptions] = None) -> 'AsyncUDPSocket':
+        self = cls(addr, options)
+        loop = asyncio.get_running_loop()
+        self.endpoint, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(lambda data, addr: self._datagram_received(data)),
+            remote_addr=self.binding, family=socket.AF_INET)
+        self.options.apply(self.endpoint.get_extra_info('socket'))
+        return self
+
+    async def send(self, data: bytes):
+        if self.closed:
+            raise ClosedSocketError()
+        self.endpoint.sendto(data)
+
+    def close(self):
+        super().close()
+        self.endpoint.close()
+
+
+class AsyncUDPSession(_QueuedDatagramSocket):
+    """One client's view of an AsyncServerUDPSocket. Created by the server socket, not the user"""
+    def __init__(self, server: 'AsyncServerUDPSocket', peer):
+        super().__init__()
+        self.server = server
+        self.binding = peer
+
+    async def send(self, data: bytes):
+        if self.closed:
+            raise ClosedSocketError()
+        self.server.endpoint.sendto(data, self.binding)
+
+    def close(self):
+        super().close()
+        self.server._remove_session(self)
+
+
+class AsyncServerUDPSocket():
+    """Server side UDP socket, that hands out a session per client address"""
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        self.options = SocketOptions() if options is None else options
+        self.binding = (addr, self.options.port)
+        self.endpoint: Union[None, asyncio.DatagramTransport] = None
+        self.sessions: dict[any, AsyncUDPSession] = {}
+        self.new_sessions: asyncio.Queue[AsyncUDPSession] = asyncio.Queue()
+
+    @classmethod
+    async def bind(cls, addr: str, options: Union[None, SocketOptions] = None) -> 'AsyncServerUDPSocket':
+        self = cls(addr, options)
+        loop = asyncio.get_running_loop()
+        self.endpoint, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self._route), local_addr=self.binding, family=socket.AF_INET,
+            reuse_port=self.options.reuseport or None)
+        self.options.apply(self.endpoint.get_extra_info('socket'))
+        return self
+
+    def _route(self, data: bytes, peer):
+        """Deliver a datagram to the session for its sender, starting a new session if needed"""
+        session = self.sessions.get(peer)
+        if session is None:
+            session = AsyncUDPSession(self, peer)
+            self.sessions[peer] = session
+            self.new_sessions.put_nowait(session)
+        session._datagram_received(data)
+
+    def _remove_session(self, session: AsyncUDPSession):
+        if self.sessions.get(session.binding) is session:
+            del self.sessions[session.binding]
+
+    async def accept(self) -> AsyncUDPSession:
+        """Wait for datagrams from a new client, and return its session"""
+        return await self.new_sessions.get()
+
+    def close(self):
+        for session in list(self.sessions.values()):
+            session._datagram_received(None)
+        self.sessions.clear()
+        self.endpoint.close()
+
+
+class AsyncTCPSocket(_QueuedDatagramSocket):
+    """
+    A TCP connection, either made by a client with connect() or accepted by a server.
+    A task reads whole packets off the stream onto the queue, so a receive that
+    times out can't leave us part way through a packet
+    """
+
+    """Length prefix put before each packet"""
+    FRAME_LEN_FORMAT = TCPSocket.FRAME_LEN_FORMAT
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 options: Union[None, SocketOptions] = None):
+        super().__init__()
+        self.options = SocketOptions() if options is None else options
+        self.reader = reader
+        self.writer = writer
+        self.options.apply(writer.get_extra_info('socket'))
+        self.binding = writer.get_extra_info('peername')
+        self.read_task = asyncio.get_running_loop().create_task(self._read_frames())
+
+    @classmethod
+    async def connect(cls, addr: str, options: Union[None, SocketOptions] = None) -> 'AsyncTCPSocket':
+        options = SocketOptions() if options is None else options
+        reader, writer = await asyncio.open_connection(addr, options.port, family=socket.AF_INET)
+        return cls(reader, writer, options)
+
+    async def send(self, data: bytes):
+        if self.closed:
+            raise ClosedSocketError()
+        try:
+            self.writer.write(struct.pack(self.FRAME_LEN_FORMAT, len(data)))
+            self.writer.write(data)
+            await self.writer.drain()
+        except ConnectionError:
+            # the peer has gone, which the layers above see as the socket closing
+            raise ClosedSocketError()
+
+    async def _read_frames(self):
+        """Put each packet received on the queue, then None once the peer closes the connection"""
+        try:
+            while True:
+                prefix = await self.reader.readexactly(struct.calcsize(self.FRAME_LEN_FORMAT))
+                (length,) = struct.unpack(self.FRAME_LEN_FORMAT, prefix)
+                self._datagram_received(await self.reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._datagram_received(None)
+
+    def close(self):
+        super().close()
+        self.read_task.cancel()
+        self.writer.close()
+
+
+class AsyncServerTCPSocket():
+    """
+    Server side TCP socket, that hands out an AsyncTCPSocket per accepted connection.
+    Each connection gets our options, as the listening socket's aren't all inherited
+    """
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        self.options = SocketOptions() if options is None else options
+        self.binding = (addr, self.options.port)
+        self.server: Union[None, asyncio.AbstractServer] = None
+        self.new_connections: asyncio.Queue[AsyncTCPSocket] = asyncio.Queue()
+
+    @classmethod
+    async def bind(cls, addr: str, options: Union[None, SocketOptions] = None) -> 'AsyncServerTCPSocket':
+        self = cls(addr, options)
+        self.server = await asyncio.start_server(
+            lambda reader, writer: self.new_connections.put_nowait(AsyncTCPSocket(reader, writer, self.options)),
+            *self.binding, family=socket.AF_INET, reuse_address=True, reuse_port=self.options.reuseport or None)
+        return self
+
+    async def accept(self) -> AsyncTCPSocket:
+        """Wait for a new connection"""
+        return await self.new_connections.get()
+
+    def close(self):
+        self.server.close()
+
+
+class AsyncSocketFactory():
+    """Async counterpart of SocketFactory. Returns a coroutine function that makes the socket"""
+    @staticmethod
+    def new_socket(client_server: str, sock_type: str):
+        if sock_type == 'tcp':
+            if client_server == 'client':
+                return AsyncTCPSocket.connect
+            if client_server == 'server':
+                return AsyncServerTCPSocket.bind
+            raise ValueError("Invalid client/server type")
+        elif sock_type == 'udp':
+            if client_server == 'client':
+                return AsyncUDPSocket.connect
+            if client_server == 'server':
+                return AsyncServerUDPSocket.bind
+            raise ValueError("Invalid client/server type")
+        raise ValueError("Invalid socket type")
@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark of the RDT protocols over loopback.
+
+For each combination of RDT version, message size, error profile and
+transport, this starts an echo server (a MessengerServer) in one process and
+N clients in others. Each client sends its messages one at a time, timing each
+round trip. It reports, for every run:
+    - throughput: bytes put on the wire by both ends (headers, ACKs and re-sends included), per second
+    - goodput: message bytes delivered (both ways), per second
+    - p50/p95/p99 round trip latency of a message
+    - retransmission ratio: packets re-sent per packet sent for the first time
+
+as a table, and optionally as JSON so that runs can be compared for regressions.
+An error profile is `prob:num:burst`, as for simple_client.py's --error_prob,
+--error_num and --burst.
+
+    python3 bench.py --versions 2.2 3.0 --sizes 64 4096 --errors 0:1:0 10:1:0 --json results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import time
+
+import messenger
+import rdt_protocol
+import report
+from rdt_protocol import RDTFactory
+from transport import GenericSocket, SocketOptions
+
+"""Default clients run at once"""
+DEFAULT_CLIENTS = 4
+"""Default messages sent by each client"""
+DEFAULT_MESSAGES = 20
+"""Longest (in seconds) a run can take before it's abandoned"""
+RUN_TIMEOUT = 120
+"""Percentiles of the message latency that are reported"""
+PERCENTILES = (50, 95, 99)
+
+
+def _quiet():
+    """Silence a worker process. Printing every packet would dominate the timings"""
+    rdt_protocol.VERBOSE = False
+    sys.stdout = open(os.devnull, 'w')
+
+def _create_rdt(config: dict) -> rdt_protocol.RDTProtocolStrategy:
+    rdt = RDTFactory.create(config["version"], config["error_prob"], config["error_num"], config["burst"])
+    if isinstance(rdt, rdt_protocol.RDTProtocol_v3):
+        rdt.SIMULATED_DELAY = tuple(config["v3_delay"])
+    return rdt
+
+
+def _echo(m: messenger.SessionMessenger, stats_queue: multiprocessing.Queue):
+    """Server handler: send each message straight back, then report what was sent"""
+    try:
+        while (data := m.receive()) not in (b"FINMSG", b""):
+            m.send(data)
+    finally:
+        stats_queue.put(m.rdt.stats)
+
+def _serve(config: dict, ready: multiprocessing.Event, stats_queue: multiprocessing.Queue):
+    """Entry point of the server process"""
+    _quiet()
+    server = messenger.MessengerServer(config["transport"], 'localhost', lambda: _create_rdt(config),
+                                       lambda m: _echo(m, stats_queue), workers=config["clients"],
+                                       socket_options=SocketOptions(port=config["port"]))
+    ready.set()
+    server.serve_forever()
+
+
+def _client(config: dict) -> dict:
+    """Entry point of a client process. Returns its latencies, bytes delivered and stats"""
+    _quiet()
+    m = messenger.ClientMessenger(config["transport"], 'localhost', _create_rdt(config),
+                                  socket_options=SocketOptions(port=config["port"]))
+    latencies = []
+    delivered = 0
+    mismatches = 0
+    for _ in range(config["messages"]):
+        data = os.urandom(config["size"])
+        start = time.perf_counter()
+        m.send(data)
+        reply = m.receive()
+        latencies.append(time.perf_counter() - start)
+        delivered += len(data) + len(reply)
+        mismatches += reply != data
+    m.finish()
+    return {"latencies": latencies, "delivered": delivered, "mismatches": mismatches, "stats": m.rdt.stats}
+
+
+def _percentile(values: list[float], p: float) -> float:
+    """The p-th percentile of `values`, by the nearest rank"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))]
+
+def run(config: dict) -> dict:
+    """Run one benchmark, returning its config and results"""
+    ready = multiprocessing.Event()
+    stats_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(config, ready, stats_queue), daemon=True)
+    server.start()
+    result = dict(config)
+    try:
+        if not ready.wait(10):
+            raise TimeoutError("server didn't start")
+        with multiprocessing.Pool(config["clients"]) as pool:
+            start = time.perf_counter()
+            clients = pool.map_async(_client, [config] * config["clients"]).get(RUN_TIMEOUT)
+            elapsed = time.perf_counter() - start
+        # each of the server's sessions reports its stats once its client has finished
+        stats = [c["stats"] for c in clients] + [stats_queue.get(timeout=10) for _ in clients]
+    except multiprocessing.TimeoutError:
+        result["error"] = f"timed out after {RUN_TIMEOUT}s"
+        return result
+    except (TimeoutError, queue.Empty) as e:
+        result["error"] = str(e) or "no stats from the server"
+        return result
+    finally:
+        server.terminate()
+        server.join()
+
+    latencies = [l for c in clients for l in c["latencies"]]
+    sent = sum(s["packets_sent"] for s in stats)
+    resent = sum(s["resent"] for s in stats)
+    result.update({
+        "elapsed": elapsed,
+        "messages_per_s": len(latencies) / elapsed,
+        "throughput_MBps": sum(s["bytes_sent"] for s in stats) / elapsed / 1e6,
+        "goodput_MBps": sum(c["delivered"] for c in clients) / elapsed / 1e6,
+        "retransmission_ratio": resent / (sent - resent) if sent > resent else 0.0,
+        "mismatches": sum(c["mismatches"] for c in clients),
+    })
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = _percentile(latencies, p) * 1000
+    return result
+
+
+def configs(args: argparse.Namespace) -> list[dict]:
+    """Every combination of the swept parameters, each with its own port"""
+    out = []
+    for transport in args.transports:
+        for version in args.versions:
+            for size in args.sizes:
+                for profile in args.errors:
+                    error_prob, error_num, burst = profile.split(':')
+                    out.append({"transport": transport, "version": version, "size": size,
+                                "error_prob": float(error_prob), "error_num": int(error_num), "burst": int(burst),
+                                "clients": args.clients, "messages": args.messages,
+                                "v3_delay": args.v3_delay, "port": args.port + len(out)})
+    return out
+
+def print_table(results: list[dict]):
+    columns = [("transport", "{}"), ("version", "{}"), ("size", "{}"), ("errors", "{}"), ("msg/s", "{:.1f}"),
+               ("thru MB/s", "{:.3f}"), ("good MB/s", "{:.3f}")] + \
+              [(f"p{p} ms", "{:.2f}") for p in PERCENTILES] + [("retx", "{:.3f}"), ("bad", "{}")]
+    rows = []
+    for r in results:
+        row = [r["transport"], r["version"], str(r["size"]), f"{r['error_prob']:g}:{r['error_num']}:{r['burst']}"]
+        if "error" in r:
+            row += [r["error"]]
+        else:
+            values = [r["messages_per_s"], r["throughput_MBps"], r["goodput_MBps"]] + \
+                     [r[f"p{p}_ms"] for p in PERCENTILES] + [r["retransmission_ratio"], r["mismatches"]]
+            row += [fmt.format(v) for (_, fmt), v in zip(columns[4:], values)]
+        rows.append(row)
+    report.print_table([name for name, _ in columns], rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the RDT protocols end to end over loopback")
+    parser.add_argument('--versions', nargs='+', default=list(RDTFactory.VERSIONS), choices=RDTFactory.VERSIONS,
+                        help='RDT versions to run (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[64, 1024],
+                        help='Message sizes in bytes (default: %(default)s)')
+    parser.add_argument('--errors', nargs='+', default=['0:1:0', '10:1:0'],
+                        help='Error profiles as prob:num:burst (default: %(default)s)')
+    parser.add_argument('--transports', nargs='+', default=['udp', 'tcp'], choices=['udp', 'tcp'],
+                        help='Socket types to run over (default: %(default)s)')
+    parser.add_argument('--clients', type=int, default=DEFAULT_CLIENTS,
+                        help='Clients run at once (default: %(default)s)')
+    parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES,
+                        help='Messages sent by each client (default: %(default)s)')
+    parser.add_argument('--v3_delay', nargs=2, type=int, default=[0, 0], metavar=('MIN', 'MAX'),
+                        help='Range of RDT 3.0\'s simulated reply delay, in seconds (default: 0 0)')
+    parser.add_argument('--port', type=int, default=GenericSocket.DEFAULT_PORT + 100,
+                        help='First port to use. Each run uses the next one (default: %(default)s)')
+    parser.add_argument('--json', default=None, metavar='PATH',
+                        help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = configs(args)
+    results = []
+    for config in runs:
+        results.append(run(config))
+        print(f"{len(results)} of {len(runs)} runs done", file=sys.stderr)
+    print_table(results)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "time": time.strftime('%Y-%m-%dT%H:%M:%S'), "results": results}, f, indent=2)
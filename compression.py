@@ -0,0 +1,62 @@
+"""
+Optional compression stage for the Messenger. Messages are compressed as a
+whole before they are split into packets, so a compressible message needs
+fewer packets (and so fewer ACK round trips on the stop-and-wait versions).
+
+The codec used is carried in the packet header flags, so the receiver always
+knows whether, and how, to decompress. Only stdlib codecs are used, though
+`lzma` and `bz2` can be missing from minimal Python builds, in which case they
+are simply not offered.
+"""
+
+import zlib
+from typing import Union
+
+# name -> (compress(data, level), decompress(data), default level)
+CODECS = {
+    'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+}
+try:
+    import lzma
+    CODECS['lzma'] = (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6)
+except ImportError:
+    pass
+try:
+    import bz2
+    CODECS['bz2'] = (lambda data, level: bz2.compress(data, level), bz2.decompress, 9)
+except ImportError:
+    pass
+
+
+class Compressor():
+    """Compresses messages with one codec, skipping those that won't benefit"""
+
+    """Messages shorter than this (in bytes) are sent uncompressed"""
+    DEFAULT_THRESHOLD = 64
+
+    def __init__(self, codec: str = 'zlib', level: Union[None, int] = None, threshold: int = DEFAULT_THRESHOLD):
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported compression codec: {codec}")
+        self.codec = codec
+        self.level = CODECS[codec][2] if level is None else level
+        self.threshold = threshold
+
+    def compress(self, data: bytes) -> tuple[bytes, Union[None, str]]:
+        """
+        Compress a message. Returns the payload to send and the codec used,
+        which is None if the message was left as-is because it was too short
+        or didn't get any smaller
+        """
+        if len(data) < self.threshold:
+            return data, None
+        compressed = CODECS[self.codec][0](data, self.level)
+        if len(compressed) >= len(data):
+            return data, None
+        return compressed, self.codec
+
+    @staticmethod
+    def decompress(data: bytes, codec: str) -> bytes:
+        """Undo compress() for a payload that was compressed with `codec`"""
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported compression codec: {codec}")
+        return CODECS[codec][1](data)
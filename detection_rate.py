@@ -0,0 +1,254 @@
+"""
+Exact error detection rates of the checksums, by enumerating the error space.
+
+checksum_performance_test.py and parity_check2D_performance_testing.py estimate
+how many corrupt messages each check catches by corrupting a message at random
+10^5 times. For a few bit errors, or a single burst, the errors a message can
+suffer are few enough to count exactly, which this does instead:
+    - bits:k covers every pattern of exactly k flipped bits, C(n, k) of them for n bits
+    - burst:L covers a burst of L flipped bits at every one of its n-L+1 positions
+
+Neither check needs a corrupt message built for every pattern:
+    - 2D parity is XOR-linear, so the parity of a corrupt message is the
+      original's parity XOR the parity of the error pattern. Whether an error
+      is caught (or corrected) depends only on the pattern, never the message
+    - the UDP checksum is a one's complement sum, which is a sum mod 255, so
+      flipping a bit adds or takes away that bit's weight whatever the other
+      bits are. An error goes undetected when its weights sum to 0 mod 255
+
+For bits:k the patterns are counted by dynamic programming over the bits
+(or over the rows, for 2D parity) rather than visited one by one, so even
+C(504, 3) = 21 million patterns take a fraction of a second. Results are
+counted as the sampling scripts count them: an error the 2D parity check
+corrects counts as detected and as corrected.
+
+Results are cached on disk by codec, message length and pattern (and, for the
+checksum, a digest of the message, as its results depend on the message).
+
+    python3 detection_rate.py --bits 1 2 3 --bursts 2 4 8 16
+"""
+
+import argparse
+import hashlib
+import os
+import random
+from math import comb
+
+import numpy as np
+
+import rdt_functionality
+from rdt_functionality import BYTE_SIZE
+from report import print_results, load_cache, open_cache, add_to_cache
+
+"""Codecs the rates can be found for"""
+CODECS = ('udp_checksum', 'parity_2d')
+"""Default message, the one checksum_performance_test.py samples"""
+DEFAULT_MESSAGE = "Hello, World! This is a test of the performance of checksum. :)"
+"""Default cache file. Each line is one result"""
+DEFAULT_CACHE = os.path.join('.cache', 'detection_rate.jsonl')
+"""Bumped when the way results are counted changes, so old cached results aren't used"""
+CACHE_VERSION = 1
+"""Columns of the printed table, as (name, key, format)"""
+TABLE_COLUMNS = [("codec", "codec", "{}"), ("length", "length", "{}"), ("pattern", "pattern", "{}"),
+                 ("patterns", "patterns", "{}"), ("undetected", "undetected", "{}"),
+                 ("detected %", "detected_pct", "{:.6f}"), ("corrected %", "corrected_pct", "{:.6f}")]
+# a one's complement byte sum is the sum mod 255
+_MODULUS = 0xFF
+
+
+def _bit_weights(message: bytes) -> list[int]:
+    """
+    How much flipping each bit (in bytes2Bin() order) changes the message's
+    byte sum, mod 255: adding the bit's place value if it was 0, taking it
+    away if it was 1
+    """
+    weights = []
+    for byte in message:
+        for shift in range(BYTE_SIZE - 1, -1, -1):
+            value = 1 << shift
+            weights.append((_MODULUS - value) % _MODULUS if byte & value else value)
+    return weights
+
+def _checksum(message: bytes) -> int:
+    """generateUDPChecksum() as an int: the complement of the end-around carry byte sum"""
+    total = 0
+    for byte in message:
+        total += byte
+        if total > _MODULUS:
+            total -= _MODULUS
+    return _MODULUS - total
+
+def _checksum_bits(message: bytes, k: int) -> dict[str, int]:
+    weights = _bit_weights(message)
+    # ways[j][r]: patterns of j flipped bits, among the bits so far, whose weights sum to r mod 255
+    ways = [[0] * _MODULUS for _ in range(k + 1)]
+    ways[0][0] = 1
+    for weight in weights:
+        for j in range(k, 0, -1):
+            below, here = ways[j - 1], ways[j]
+            for r in range(_MODULUS):
+                if below[r]:
+                    here[(r + weight) % _MODULUS] += below[r]
+    undetected = ways[k][0]
+    # an end-around carry sum of only zero bytes is 0 rather than 255, so a checksum of 0 catches
+    # the one pattern that clears every set bit, though its weights sum to 0
+    if _checksum(message) == 0 and k == sum(bin(b).count('1') for b in message):
+        undetected -= 1
+    return {"patterns": comb(len(weights), k), "undetected": undetected, "corrected": 0}
+
+def _checksum_burst(message: bytes, length: int) -> dict[str, int]:
+    weights = _bit_weights(message)
+    n_bits = len(weights)
+    value = int.from_bytes(message, 'big')
+    undetected = 0
+    for start in range(n_bits - length + 1):
+        if sum(weights[start:start+length]) % _MODULUS:
+            continue
+        mask = ((1 << length) - 1) << (n_bits - start - length)
+        # as for _checksum_bits(), clearing every set bit is caught by a checksum of 0
+        if value ^ mask or _checksum(message) != 0:
+            undetected += 1
+    return {"patterns": n_bits - length + 1, "undetected": undetected, "corrected": 0}
+
+
+def _parity_outcome(rows: set[int], columns: int, n_flipped: int) -> str:
+    """
+    What verify2DParityCheck() makes of an error pattern of `n_flipped` bits,
+    given the rows and the columns (as a bitmask) it flips an odd number of bits in
+    """
+    odd_columns = bin(columns).count('1')
+    if len(rows) > 1 or odd_columns > 1 or len(rows) != odd_columns:
+        return "detected"
+    if len(rows) == 1 and n_flipped == 1:
+        # the bit where the odd row and column cross is flipped back
+        return "corrected"
+    # otherwise the wrong bit is flipped back, or the error leaves the parity as it was
+    return "undetected"
+
+def _parity_bits(message: bytes, k: int) -> dict[str, int]:
+    n_rows = len(message)
+    patterns = comb(n_rows * BYTE_SIZE, k)
+    # counts can outgrow an int64 for long messages and many bits
+    dtype = np.int64 if patterns < 2**62 else object
+    # ways[j, o, c]: patterns of j flipped bits over the rows so far, with o odd rows (2 meaning 2 or more)
+    # and c the mask of odd columns
+    ways = np.zeros((k + 1, 3, 1 << BYTE_SIZE), dtype=dtype)
+    ways[0, 0, 0] = 1
+    columns = np.arange(1 << BYTE_SIZE)
+    row_patterns = [(v, bin(v).count('1')) for v in range(1 << BYTE_SIZE) if bin(v).count('1') <= k]
+    for _ in range(n_rows):
+        new = np.zeros_like(ways)
+        for v, w in row_patterns:
+            # flipping the bits of v in this row toggles the columns in v
+            moved = ways[:k + 1 - w][:, :, columns ^ v]
+            if w % 2:
+                new[w:, 1] += moved[:, 0]
+                new[w:, 2] += moved[:, 1] + moved[:, 2]
+            else:
+                new[w:] += moved
+        ways = new
+    one_column = [c for c in range(1 << BYTE_SIZE) if bin(c).count('1') == 1]
+    crossing = int(sum(ways[k, 1, c] for c in one_column))
+    # with one odd row and one odd column, only a single flipped bit is put right. Anything more is miscorrected
+    corrected = crossing if k == 1 else 0
+    undetected = int(ways[k, 0, 0]) + crossing - corrected
+    return {"patterns": patterns, "undetected": undetected, "corrected": corrected}
+
+def _parity_burst(message: bytes, length: int) -> dict[str, int]:
+    n_bits = len(message) * BYTE_SIZE
+    counts = {"patterns": n_bits - length + 1, "undetected": 0, "corrected": 0}
+    for start in range(n_bits - length + 1):
+        flipped = range(start, start + length)
+        rows = {row for row in range(start // BYTE_SIZE, (start + length - 1) // BYTE_SIZE + 1)
+                if sum(1 for i in flipped if i // BYTE_SIZE == row) % 2}
+        columns = 0
+        for i in flipped:
+            columns ^= 1 << (i % BYTE_SIZE)
+        outcome = _parity_outcome(rows, columns, length)
+        if outcome != "detected":
+            counts[outcome] += 1
+    return counts
+
+
+def cache_key(codec: str, message: bytes, pattern: str) -> str:
+    """The key a result is cached under. 2D parity's results only depend on the message's length"""
+    key = f"v{CACHE_VERSION}:{codec}:{len(message)}:{pattern}"
+    if codec == 'udp_checksum':
+        key += ':' + hashlib.sha256(message).hexdigest()[:16]
+    return key
+
+
+def exact_rate(codec: str, message: bytes, bits: int = 0, burst: int = 0,
+               cache: dict[str, dict] = None) -> dict[str, any]:
+    """
+    The exact detection and correction rate of `codec` on `message`, over every
+    pattern of `bits` flipped bits, or else every position of a `burst` long burst.
+    `cache` (as from load_cache()) is looked in first, and the result added to it
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec}")
+    if (bits > 0) == (burst > 0):
+        raise ValueError("Give one of bits or burst")
+    if not message:
+        raise ValueError("Empty message")
+    if burst > len(message) * BYTE_SIZE:
+        raise ValueError(f"A {burst} bit burst is longer than the {len(message) * BYTE_SIZE} bit message")
+
+    pattern = f"bits:{bits}" if bits else f"burst:{burst}"
+    key = cache_key(codec, message, pattern)
+    if cache is not None and key in cache:
+        counts = cache[key]
+    else:
+        if codec == 'udp_checksum':
+            counts = _checksum_bits(message, bits) if bits else _checksum_burst(message, burst)
+        else:
+            counts = _parity_bits(message, bits) if bits else _parity_burst(message, burst)
+        if cache is not None:
+            cache[key] = counts
+
+    detected = counts["patterns"] - counts["undetected"]
+    return {"codec": codec, "length": len(message), "pattern": pattern, **counts, "detected": detected,
+            "detected_pct": detected / counts["patterns"] * 100,
+            "corrected_pct": counts["corrected"] / counts["patterns"] * 100}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exact error detection rates of the checksums, by enumerating every error")
+    parser.add_argument('--codecs', nargs='+', default=list(CODECS), choices=CODECS,
+                        help='Checks to find the rates of (default: all)')
+    parser.add_argument('--bits', nargs='*', type=int, default=[1, 2, 3],
+                        help='Numbers of flipped bits (default: %(default)s)')
+    parser.add_argument('--bursts', nargs='*', type=int, default=[2, 4, 8, 16],
+                        help='Burst lengths (default: %(default)s)')
+    parser.add_argument('--message', default=DEFAULT_MESSAGE,
+                        help='Message to corrupt (default: checksum_performance_test.py\'s sample)')
+    parser.add_argument('--length', type=int, default=None,
+                        help='Corrupt a message of this many random bytes, seeded by rdt_functionality.SEED, instead')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, metavar='PATH',
+                        help='Cache file (default: %(default)s)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Neither read nor write the cache')
+    args = parser.parse_args()
+    if any(n < 1 for n in args.bits + args.bursts):
+        parser.error("bit counts and burst lengths must be at least 1")
+
+    if args.length is not None:
+        message = random.Random(rdt_functionality.SEED).randbytes(args.length)
+    else:
+        message = args.message.encode('utf-8')
+    cache = load_cache(args.cache) if args.use_cache else None
+    cached = set() if cache is None else set(cache)
+
+    results = []
+    for codec in args.codecs:
+        for bits in args.bits:
+            results.append(exact_rate(codec, message, bits=bits, cache=cache))
+        for burst in args.bursts:
+            results.append(exact_rate(codec, message, burst=burst, cache=cache))
+    print_results(results, TABLE_COLUMNS)
+
+    # only the results that weren't already cached are added
+    if cache is not None and len(cache) > len(cached):
+        with open_cache(args.cache) as f:
+            for key in cache.keys() - cached:
+                add_to_cache(f, key, cache[key])
@@ -0,0 +1,121 @@
+"""
+Bulk file transfer over a Messenger, used by the --send-file and --recv-dir
+modes of simple_client.py and simple_server.py.
+
+The sender memory-maps the file and sends it as a series of messages, each a
+memoryview slice of the map, so the file is never copied into memory as a
+whole. It's announced first with a message `FILE <size> <name>`. The receiver
+creates a file of that size, memory-maps it, and has each message written
+straight into the map at its offset with Messenger.receive_into(). It then
+replies `DONE <size>`, so the sender's timing covers the whole transfer.
+If the sender finishes, or stops sending, before the whole file has arrived,
+the partial file is removed and TransferError raised.
+
+Only one message's packets are held at a time, so memory use stays the same
+however large the file is.
+"""
+
+import mmap
+import os
+import time
+
+from messenger import Messenger
+from transport import ClosedSocketError
+
+"""Most bytes of the file sent in one message"""
+CHUNK_LEN = 1 << 20
+"""Start of the message announcing a file"""
+FILE_PREFIX = b"FILE "
+"""Longest (in seconds) the receiver waits for the next part of a file"""
+RECEIVE_TIMEOUT = 30
+"""Socket types that can drop packets, which RDT 1.0 has no way to resend"""
+LOSSY_SOCK_TYPES = ('udp',)
+
+
+class TransferError(Exception):
+    """The file didn't arrive whole"""
+
+
+def send_file(m: Messenger, path: str) -> tuple[int, float]:
+    """Send the file at `path`. Returns its size and the seconds the transfer took"""
+    if m.rdt.VERSION == '1.0' and m.sock_type in LOSSY_SOCK_TYPES:
+        # a dropped packet would leave a hole in the file, or be filled from the next message
+        raise ValueError(f"Files can't be sent with RDT 1.0 over {m.sock_type}, as it can't resend lost packets")
+    size = os.path.getsize(path)
+    # each message must fit in the packets the header's sequence numbers can count
+    chunk_len = min(CHUNK_LEN, m.rdt.PACKET_DATA_LEN * (10 ** m.rdt.N_SEQ_DIGITS - 1))
+
+    start = time.perf_counter()
+    m.send(FILE_PREFIX + f"{size} {os.path.basename(path)}".encode())
+    if size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_len):
+                    m.send(view[offset:offset+chunk_len])
+            finally:
+                # the map can't be closed while there's a view of it
+                view.release()
+    reply = m.receive()
+    if reply != b"DONE %d" % size:
+        raise ValueError(f"Unexpected reply to file transfer: {reply}")
+    return size, time.perf_counter() - start
+
+
+def receive_file(m: Messenger, announcement: bytes, directory: str) -> tuple[str, int, float]:
+    """
+    Receive the file announced by `announcement` (a message starting with FILE_PREFIX)
+    into `directory`. Returns where it was written, its size, and the seconds the transfer took
+    """
+    size, name = announcement[len(FILE_PREFIX):].decode().split(' ', 1)
+    size = int(size)
+    # only the name is used, so the sender can't write outside the directory
+    path = os.path.join(directory, os.path.basename(name))
+
+    start = time.perf_counter()
+    try:
+        with open(path, 'w+b') as f:
+            # preallocated, so every message can be written straight to its place in the map
+            f.truncate(size)
+            if size:
+                with mmap.mmap(f.fileno(), size) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        _receive_parts(m, view)
+                    finally:
+                        view.release()
+    except BaseException:
+        # don't leave a file that looks whole but isn't
+        os.remove(path)
+        raise
+    m.send(b"DONE %d" % size)
+    return path, size, time.perf_counter() - start
+
+
+def _receive_parts(m: Messenger, view: memoryview):
+    """Receive messages into `view` until it is full"""
+    size = len(view)
+    offset = 0
+    while offset < size:
+        if not m.wait_readable(RECEIVE_TIMEOUT):
+            raise TransferError(f"Nothing received for {RECEIVE_TIMEOUT}s, after {offset} of {size} bytes")
+        # raised once the receive's exception is gone, as its traceback holds views of the map,
+        # which can't be closed while they're alive
+        failure = None
+        try:
+            n = m.receive_into(view[offset:])
+        except ClosedSocketError:
+            failure = f"The sender finished after {offset} of {size} bytes"
+        except ValueError as e:
+            # a message that runs past the end of the file
+            failure = f"More than the {size} bytes announced: {e}"
+        if failure is not None:
+            raise TransferError(failure)
+        if n == 0:
+            raise TransferError(f"Empty message after {offset} of {size} bytes")
+        offset += n
+
+
+def rate(size: int, seconds: float) -> str:
+    """A transfer rate, for printing"""
+    return f"{size / 1e6 / seconds:.2f} MB/s" if seconds else "-"
@@ -0,0 +1,153 @@
+"""
+Connection set up for the Messenger, so the two ends agree on how to talk
+rather than relying on both being started with the same settings.
+
+The client sends a SYN packet offering the settings it can use, and the server
+replies with a SYN-ACK holding the settings chosen from those it also supports,
+or a SYN-NACK saying why there are none. The settings are:
+    - the RDT version, the first of the client's (in order of preference) that the server supports
+    - the most payload bytes per packet, the smaller of the two ends' limits
+    - the window, the most packets sent before waiting, again the smaller of the two
+    - the checksum, the first of the client's that the server supports
+    - the compression codec, the first of the client's that the server supports, if any
+
+The handshake packets use the RDT2.2 header, which every RDT version can parse,
+and are never corrupted. The SYN is re-sent if no reply arrives in time.
+"""
+
+import time
+from typing import Union
+
+from transport import GenericSocket, ClosedSocketError
+from rdt_protocol import RDTProtocolStrategy, RDTProtocol_v2_2
+
+"""Checksums that can protect the packets"""
+CHECKSUMS = ['udp']
+"""Number of times the SYN is sent before giving up"""
+SYN_RETRIES = 3
+
+SYN = RDTProtocolStrategy.FLAGS["SYN"]
+ACK = RDTProtocolStrategy.FLAGS["ACK"]
+NACK = RDTProtocolStrategy.FLAGS["NACK"]
+
+# frames the handshake packets, with room for all the settings in one packet
+_framing = RDTProtocol_v2_2(0, 0, 0)
+_framing.PACKET_DATA_LEN = GenericSocket.BUFFLEN - RDTProtocolStrategy.MAX_HEADER_LEN
+# reads only the header fields every version sends, as the reply to a SYN may come from any of them
+_reader = RDTProtocolStrategy(0, 0, 0)
+
+
+class ConnectionParams():
+    """
+    Settings for a connection. Offered by each end with the values it can use,
+    in order of preference, and agreed with a single value for each
+    """
+    def __init__(self, versions: list[str], payload_len: int, window: int,
+                 checksums: list[str] = CHECKSUMS, codecs: list[str] = []):
+        self.versions = list(versions)
+        self.payload_len = payload_len
+        self.window = window
+        self.checksums = list(checksums)
+        # no codecs means messages aren't compressed
+        self.codecs = list(codecs)
+
+    @property
+    def version(self) -> str:
+        """The (first) RDT version"""
+        return self.versions[0]
+
+    @property
+    def codec(self) -> Union[None, str]:
+        """The (first) compression codec, or None for no compression"""
+        return self.codecs[0] if self.codecs else None
+
+    def agree(self, offer: 'ConnectionParams') -> 'ConnectionParams':
+        """
+        Choose the settings for a connection from the client's `offer` and what we support.
+        Raises HandshakeError if there's no version or checksum that both ends support
+        """
+        versions = [v for v in offer.versions if v in self.versions]
+        if not versions:
+            raise HandshakeError(f"No common RDT version: offered {','.join(offer.versions)}, "
+                                 f"supported {','.join(self.versions)}")
+        checksums = [c for c in offer.checksums if c in self.checksums]
+        if not checksums:
+            raise HandshakeError(f"No common checksum: offered {','.join(offer.checksums)}, "
+                                 f"supported {','.join(self.checksums)}")
+        codecs = [c for c in offer.codecs if c in self.codecs]
+        return ConnectionParams(versions[:1], min(self.payload_len, offer.payload_len),
+                                min(self.window, offer.window), checksums[:1], codecs[:1])
+
+    def apply(self, rdt: RDTProtocolStrategy):
+        """Set an RDT strategy's packet size and window to the agreed ones"""
+        rdt.PACKET_DATA_LEN = self.payload_len
+        rdt.window = self.window
+
+    def encode(self) -> bytes:
+        return (f"v={','.join(self.versions)};len={self.payload_len};win={self.window};"
+                f"chk={','.join(self.checksums)};cmp={','.join(self.codecs)}").encode('ascii')
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'ConnectionParams':
+        try:
+            fields = dict(field.split('=', 1) for field in bytes(data).decode('ascii').split(';'))
+            split = lambda value: [v for v in value.split(',') if v]
+            return cls(split(fields['v']), int(fields['len']), int(fields['win']),
+                       split(fields['chk']), split(fields['cmp']))
+        except (UnicodeDecodeError, ValueError, KeyError):
+            raise HandshakeError(f"Malformed handshake: {bytes(data)}")
+
+
+def client_handshake(transport: GenericSocket, offer: ConnectionParams,
+                     timeout: float = RDTProtocolStrategy.RECV_TIMEOUT) -> ConnectionParams:
+    """Send a SYN with our offer, and return the settings the server agrees to"""
+    syn = syn_packet(offer.encode(), SYN)
+    for _ in range(SYN_RETRIES):
+        transport.send(syn)
+        deadline = time.monotonic() + timeout
+        while transport.wait_readable(max(0, deadline - time.monotonic())):
+            header, data = read_packet(transport)
+            if not header["flags"] & SYN:
+                # eg the server's RDT ACK for a SYN we re-sent after it had replied
+                continue
+            if header["flags"] & NACK:
+                raise HandshakeError(bytes(data).decode('ascii', errors='replace'))
+            return ConnectionParams.decode(data)
+    raise HandshakeError("No reply to the SYN. Is the server running with --negotiate?")
+
+
+def server_handshake(transport: GenericSocket, supported: ConnectionParams) -> ConnectionParams:
+    """Wait for a client's SYN, and reply with the settings chosen for the connection"""
+    header, data = read_packet(transport)
+    if not header["flags"] & SYN:
+        raise HandshakeError("Expected a SYN from the client. Is it running with --negotiate?")
+    try:
+        agreed = supported.agree(ConnectionParams.decode(data))
+    except HandshakeError as e:
+        transport.send(syn_packet(str(e).encode('ascii', errors='replace'), SYN | NACK))
+        raise
+    transport.send(syn_packet(agreed.encode(), SYN | ACK))
+    return agreed
+
+
+def syn_packet(data: bytes, flags: int) -> bytes:
+    """A handshake packet carrying `data`"""
+    return _framing._split_data_into_packets(data, flags)[0]
+
+def read_packet(transport: GenericSocket) -> tuple[dict[str, any], bytes]:
+    """Receive a handshake packet"""
+    view = transport.receive_view()
+    if not len(view):
+        # a stream socket whose peer has hung up
+        transport.release(view)
+        raise ClosedSocketError()
+    try:
+        header, data = _reader._extract(view)
+        return header, bytes(data)
+    finally:
+        transport.release(view)
+
+
+class HandshakeError(Exception):
+    """The two ends of a connection couldn't agree on how to talk"""
+    pass
@@ -8,51 +8,773 @@ the message into appropriate sized packets, and ensure its delivery.
 
 The ClientMessenger and ServerMessenger classes act as a convenience classes,
 setting up the required variables.
+
+A ServerMessenger talks to one client at a time. MessengerServer instead serves
+many clients on one port, giving each its own session with its own RDT
+strategy, and running a handler on a SessionMessenger for each in a pool of
+worker threads (or, for TCP, worker processes).
+
+With negotiate=True, a client and server start each connection with a
+handshake (see handshake.py) that agrees the RDT version, packet size, window,
+checksum and compression to use, rather than relying on both ends being
+started with the same settings.
+
+After multiplex() is called on both ends, open_stream() and accept_stream()
+give Messengers for further streams on the same connection (see streams.py),
+so several message exchanges can be in progress at once.
+
+send_request() builds on the streams to pipeline request/response exchanges:
+it returns a Future for the response straight away, and up to max_outstanding
+requests are in flight at once, each on a stream of its own. Every request and
+response starts with a correlation id, which the other end's receive_request()
+and send_response() use to answer requests in whatever order it likes.
+
+serve() answers requests with a handler function run on a pool of worker
+threads or processes, so requests keep being received while others are handled.
+
+A ClientMessenger given a ConnectionPool takes its transport from the pool and
+hands it back on finish(), so later sessions with the same server reuse the
+connection rather than setting up a new one.
 """
 
-import select
+import socket
+import struct
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import count
 from math import ceil
+from typing import Callable, Union
 
 from transport import *
 from rdt_protocol import *
+from compression import Compressor, CODECS
+from handshake import *
+from streams import StreamMux
 
 class Messenger():
     """The Messenger class manages communication using a custom designed protocol"""
 
-    def __init__(self, client_server: str, sock_type: str, ip: str, rdt: RDTProtocolStrategy):
+    """Length prefix put before each message in a batch"""
+    BATCH_LEN_FORMAT = '!I'
+    """Default time (in seconds) a small message can wait in the batch before it is sent"""
+    BATCH_DELAY = 0.05
+    """Correlation id put before each request and response"""
+    CORRELATION_FORMAT = '!I'
+    """Default number of requests in flight at once with send_request()"""
+    MAX_OUTSTANDING = 8
+    """Default number of requests handled at once by serve()"""
+    HANDLER_WORKERS = 4
+
+    def __init__(self, client_server: str, sock_type: str, ip: str, rdt: RDTProtocolStrategy,
+                 compressor: Union[None, Compressor] = None, batch_size: int = 0, batch_delay: float = BATCH_DELAY,
+                 socket_options: Union[None, SocketOptions] = None, negotiate: bool = False,
+                 versions: Union[None, list[str]] = None, max_outstanding: int = MAX_OUTSTANDING):
+        self.client_server = client_server
         self.sock_type: str = sock_type
         self.ip: str = ip
         # We hold the transport class so it can be used at any time to get a new socket of the right type
         self.__transport_class = SocketFactory.new_socket(client_server, sock_type)
+        self.socket_options = socket_options
         self.rdt = rdt
+        # messages are only compressed if a compressor is given, but we can always decompress
+        self.compressor = compressor
+
+        # with negotiate, the settings for the connection are agreed with the peer in a handshake.
+        # `versions` are the RDT versions we'll use, in order of preference
+        self.negotiate = negotiate
+        self.versions = [rdt.VERSION] if versions is None else list(versions)
+        self.params: Union[None, ConnectionParams] = None
+        # set by multiplex(), to carry several streams on our connection
+        self.mux: Union[None, StreamMux] = None
+
+        # batching is off unless batch_size is set. Messages smaller than batch_size are held
+        # back and sent together once batch_size bytes or batch_delay seconds have built up
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._batch: list[bytes] = []
+        self._batch_len = 0
+        self._batch_started = 0.0
+        # messages unpacked from a received batch that haven't been returned by receive() yet
+        self._received: deque[bytes] = deque()
+
+        # pipelined requests, set up by the first send_request() or receive_request().
+        # Each request in flight has a stream (a "lane") to itself, and lanes are reused once answered
+        self.max_outstanding = max_outstanding
+        self._requester: Union[None, ThreadPoolExecutor] = None
+        self._correlation_ids = count()
+        self._idle_lanes: queue.SimpleQueue['SessionMessenger'] = queue.SimpleQueue()
+        # on the answering end: requests waiting for receive_request(), with None once the peer has finished
+        # (or the error if its handshake failed), and the lane each unanswered request came in on, with
+        # an event set once it's answered
+        self._requests: Union[None, queue.Queue[Union[None, HandshakeError, tuple[int, bytes]]]] = None
+        self._unanswered: dict[int, tuple['Messenger', threading.Event]] = {}
 
     def _get_new_sock(self):
         """instantiate a socket from the class"""
-        self.transport: GenericSocket = self.__transport_class(self.ip)
+        self.transport: GenericSocket = self._new_sock()
 
-    def send(self, data: str):
+    def _new_sock(self) -> GenericSocket:
+        """A new socket of our transport class"""
+        return self.__transport_class(self.ip, options=self.socket_options)
+
+    def send(self, data: bytes):
         """Break the data up into packets and then send via the RDT protocol"""
-        self.rdt.send_fsm(self.transport, data)
+        if self._hold_for_batch(data):
+            if self._batch_due():
+                self.flush()
+            return
+
+        # keep messages in order by sending anything batched first
+        self.flush()
+        self._send_message(data)
+
+    def flush(self):
+        """Send any messages being held back for batching"""
+        batch = self._take_batch()
+        if batch is not None:
+            self._send_message(*batch)
 
-    def receive(self) -> str:
+    def receive(self) -> bytes:
         """Use our RDT protocol to receive data"""
-        received_data: list[tuple[str, str]] = self.rdt.recv_fsm(self.transport)
-        # For now, just return our data as a string
-        return ''.join([r[1] for r in received_data])
+        # the peer won't reply to messages we are still holding back
+        self.flush()
+        if self._received:
+            return self._received.popleft()
+
+        # the packets were reassembled in place, so the message isn't copied or joined
+        header, payload = self._receive_message()
+        return self._deliver(payload, header["flags"])
+
+    def wait_readable(self, timeout: Union[None, float]) -> bool:
+        """Wait up to `timeout` seconds for there to be a message to receive. Returns False if there isn't one"""
+        if self._received or self.rdt.has_pending():
+            return True
+        return self.transport.wait_readable(timeout)
+
+    def receive_into(self, buffer: memoryview) -> int:
+        """
+        Like receive(), but the message is written into `buffer` (eg a view of an mmap)
+        rather than returned, each packet's data going straight to its offset as it
+        arrives. Returns the length of the message. Raises ClosedSocketError if the
+        other end finishes instead, leaving the buffer as it was
+        """
+        self.flush()
+        if self._received:
+            data = self._received.popleft()
+        else:
+            header, payload = self._receive_message(buffer)
+            flags = header["flags"]
+            if flags & (self.rdt.CODEC_MASK | self.rdt.FLAGS["BATCH"]):
+                # these have to be decoded as a whole
+                data = self._deliver(bytes(payload), flags)
+            elif isinstance(payload, memoryview):
+                # already in the buffer
+                return len(payload)
+            else:
+                # a FINMSG, which the FSMs hand back as it is rather than writing it to the buffer
+                raise ClosedSocketError()
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _receive_message(self, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        """
+        Receive the next message with our RDT protocol, into `buffer` if one is given.
+        Returns the header of its first packet and its (still encoded) payload, which
+        is a view of the buffer it was reassembled in, or bytes for a FINMSG
+        """
+        if self.negotiate and self.params is None:
+            # the client starts the connection with a handshake
+            self._use_params(server_handshake(self.transport, self._handshake_params(list(CODECS))))
+
+        while True:
+            header, payload = self.rdt.recv_fsm(self.transport, buffer)
+            if not header["flags"] & self.rdt.FLAGS["SYN"]:
+                return header, payload
+            self._answer_late_syn()
+
+    def _handshake_params(self, codecs: list[str]) -> ConnectionParams:
+        """The settings we can use, to offer to (or choose from for) the peer in a handshake"""
+        return ConnectionParams(self.versions, self.transport.BUFFLEN - self.rdt.MAX_HEADER_LEN,
+                                self.rdt.RECV_BATCH_LEN, CHECKSUMS, codecs)
+
+    def _use_params(self, params: ConnectionParams):
+        """Switch to the settings agreed in a handshake"""
+        self.params = params
+        if params.version != self.rdt.VERSION:
+            self.rdt = RDTFactory.create(params.version, self.rdt.error_prob, self.rdt.error_num, self.rdt.burst)
+        params.apply(self.rdt)
+        if params.codec is None:
+            self.compressor = None
+        elif self.compressor is None or self.compressor.codec != params.codec:
+            self.compressor = Compressor(params.codec)
+
+    def _answer_late_syn(self):
+        """Reply to a SYN that arrived once we were exchanging messages"""
+        if self.params is not None:
+            # the client re-sent its SYN because it missed our SYN-ACK
+            self.transport.send(syn_packet(self.params.encode(), SYN | ACK))
+        else:
+            # rather than leave the client waiting, tell it we don't negotiate
+            self.transport.send(syn_packet(b"The server isn't negotiating. Is it running with --negotiate?", SYN | NACK))
+
+    def _send_message(self, data: bytes, flags: int = 0x00):
+        """Send one (possibly batched) message via the RDT protocol"""
+        payload, flags = self._encode(data, flags)
+        self.rdt.send_fsm(self.transport, payload, flags)
+
+    def _encode(self, data: bytes, flags: int = 0x00) -> tuple[bytes, int]:
+        """Apply the message-level stages before packetization. Returns the payload and its header flags"""
+        if self.compressor is not None:
+            data, codec = self.compressor.compress(data)
+            if codec is not None:
+                flags |= self.rdt.CODEC_FLAGS[codec]
+        return data, flags
+
+    def _decode(self, payload: Union[bytes, memoryview], flags: int) -> Union[bytes, memoryview]:
+        """Undo _encode() on a received payload, using the flags from its header"""
+        codec_flag = flags & self.rdt.CODEC_MASK
+        if codec_flag:
+            codec = next(c for c, f in self.rdt.CODEC_FLAGS.items() if f == codec_flag)
+            payload = Compressor.decompress(payload, codec)
+        return payload
+
+    def _hold_for_batch(self, data: bytes) -> bool:
+        """Hold a message back for batching if batching is on and it is small enough. Returns True if it was held"""
+        if not (self.batch_size and len(data) < self.batch_size):
+            return False
+        if not self._batch:
+            self._batch_started = time.monotonic()
+        self._batch.append(bytes(data))
+        self._batch_len += struct.calcsize(self.BATCH_LEN_FORMAT) + len(data)
+        return True
+
+    def _batch_due(self) -> bool:
+        """True once the held back messages have reached the batch size or delay"""
+        return self._batch_len >= self.batch_size or time.monotonic() - self._batch_started >= self.batch_delay
+
+    def _take_batch(self) -> Union[None, tuple[bytes, int]]:
+        """Empty the batch, returning the message and flags to send for it, or None if it was empty"""
+        if not self._batch:
+            return None
+        batch = self._batch
+        self._batch = []
+        self._batch_len = 0
+        if len(batch) == 1:
+            return batch[0], 0x00
+        return self._pack_batch(batch), self.rdt.FLAGS["BATCH"]
+
+    def _deliver(self, payload: Union[bytes, memoryview], flags: int) -> bytes:
+        """Decode a received payload and return its message. If it was a batch, the rest are queued for receive()"""
+        payload = self._decode(payload, flags)
+        if flags & self.rdt.FLAGS["BATCH"]:
+            self._received.extend(self._unpack_batch(payload))
+            return self._received.popleft()
+        # copied out of the reassembly buffer once, here, so callers get immutable bytes
+        return bytes(payload)
+
+    def _pack_batch(self, messages: list[bytes]) -> bytes:
+        """Join several messages into one payload, each prefixed with its length"""
+        return b''.join([struct.pack(self.BATCH_LEN_FORMAT, len(m)) + m for m in messages])
+
+    def _unpack_batch(self, payload: bytes) -> list[bytes]:
+        """Split a payload made by _pack_batch() back into its messages"""
+        messages = []
+        view = memoryview(payload)
+        prefix_len = struct.calcsize(self.BATCH_LEN_FORMAT)
+        i = 0
+        while i < len(view):
+            (length,) = struct.unpack_from(self.BATCH_LEN_FORMAT, view, i)
+            i += prefix_len
+            messages.append(bytes(view[i:i+length]))
+            i += length
+        return messages
+
+    def multiplex(self):
+        """
+        Start carrying several streams on this connection. Our own messages go on
+        stream 0, and others are opened with open_stream() or accepted from the
+        other end with accept_stream(). Both ends must call this, before any stream is opened
+        """
+        if self.mux is None:
+            self.mux = StreamMux(self.transport, initiator=self.client_server == 'client')
+            self.transport = self.mux.streams[0]
+
+    def open_stream(self) -> 'SessionMessenger':
+        """A Messenger for a new stream on our connection"""
+        self.multiplex()
+        return self._stream_messenger(self.mux.open())
+
+    def accept_stream(self) -> 'SessionMessenger':
+        """Wait for the other end to open a stream, and return a Messenger for it"""
+        self.multiplex()
+        return self._stream_messenger(self.mux.accept())
+
+    def _stream_messenger(self, stream: GenericSocket) -> 'SessionMessenger':
+        """A Messenger for one of our streams, with its own RDT strategy but our settings"""
+        rdt = RDTFactory.create(self.rdt.VERSION, self.rdt.error_prob, self.rdt.error_num, self.rdt.burst)
+        if self.params is not None:
+            self.params.apply(rdt)
+        rdt.stream_id = stream.stream_id
+        return SessionMessenger(self.sock_type, self.ip, rdt, stream, compressor=self.compressor,
+                                batch_size=self.batch_size, batch_delay=self.batch_delay)
+
+    def send_request(self, data: bytes) -> Future:
+        """
+        Send a request without waiting for the response, returning a Future for it. The other
+        end answers with receive_request() and send_response(), and both ends are multiplexed.
+        Up to max_outstanding requests are in flight at once, so on a slow link requests aren't
+        held to one per round trip. Further requests wait for one of those to be answered
+        """
+        if self._requester is None:
+            self.multiplex()
+            self._requester = ThreadPoolExecutor(max_workers=self.max_outstanding)
+        return self._requester.submit(self._exchange, next(self._correlation_ids), data)
+
+    def _exchange(self, correlation_id: int, data: bytes) -> bytes:
+        """Send one request on a free lane and wait for its response"""
+        try:
+            lane = self._idle_lanes.get_nowait()
+        except queue.Empty:
+            lane = self.open_stream()
+        lane._send_correlated(correlation_id, data)
+        response_id, response = lane._receive_correlated()
+        if response_id != correlation_id:
+            lane.finish()
+            raise ValueError(f"Expected the response to request {correlation_id}, got {response_id}")
+        self._idle_lanes.put(lane)
+        return response
+
+    def receive_request(self) -> Union[None, tuple[int, bytes]]:
+        """
+        Wait for the next request from the other end, from any of its lanes. Returns the request's
+        correlation id and data, or None once the other end has finished. Requests can be answered
+        with send_response() in any order. Plain messages sent with send() on the connection itself
+        are requests too, with negative ids, but the next won't arrive until the last is answered
+        """
+        if self._requests is None:
+            self.multiplex()
+            self._requests = queue.Queue()
+            threading.Thread(target=self._accept_lanes, daemon=True).start()
+            threading.Thread(target=self._read_connection, daemon=True).start()
+        request = self._requests.get()
+        if request is None or isinstance(request, HandshakeError):
+            # let any other callers know too
+            self._requests.put(request)
+        if isinstance(request, HandshakeError):
+            raise request
+        return request
+
+    def send_response(self, correlation_id: int, data: Union[None, bytes]):
+        """Answer the request returned by receive_request() with this correlation id. With None, nothing is sent back"""
+        lane, answered = self._unanswered.pop(correlation_id)
+        try:
+            if data is None:
+                pass
+            elif correlation_id < 0:
+                # a plain message, answered with one
+                lane.send(data)
+            else:
+                lane._send_correlated(correlation_id, data)
+        finally:
+            answered.set()
+
+    def _accept_lanes(self):
+        """Read requests from each lane the other end opens, until the connection is closed"""
+        try:
+            while True:
+                lane = self.accept_stream()
+                threading.Thread(target=self._read_lane, args=(lane,), daemon=True).start()
+        except ClosedSocketError:
+            self._requests.put(None)
+
+    def _read_lane(self, lane: 'SessionMessenger'):
+        """Queue each request from a lane. The next only comes once this one is answered"""
+        try:
+            while True:
+                correlation_id, data = lane._receive_correlated()
+                if correlation_id is None:
+                    # the FINMSG closing the lane
+                    break
+                self._queue_request(lane, correlation_id, data)
+        except (ClosedSocketError, ConnectionError):
+            pass
+        if not lane.transport.closed:
+            lane.transport.close()
+
+    def _read_connection(self):
+        """Queue each plain message on our own stream as a request, until the other end finishes"""
+        local_ids = count(-1, -1)
+        try:
+            while (data := self.receive()) not in (b"FINMSG", b""):
+                self._queue_request(self, next(local_ids), data)
+        except (ClosedSocketError, ConnectionError):
+            # the other end hung up rather than finishing
+            pass
+        except HandshakeError as e:
+            self._requests.put(e)
+            return
+        self._requests.put(None)
+
+    def _queue_request(self, lane: 'Messenger', correlation_id: int, data: bytes):
+        """Queue a request for receive_request(), and wait for it to be answered"""
+        answered = threading.Event()
+        self._unanswered[correlation_id] = (lane, answered)
+        self._requests.put((correlation_id, data))
+        # the lane's RDT strategy can't receive while the response is being sent on it
+        answered.wait()
+
+    def serve(self, handler: Callable[[bytes], Union[None, bytes]], workers: int = HANDLER_WORKERS,
+              processes: bool = False, max_in_flight: Union[None, int] = None):
+        """
+        Answer the other end's requests with `handler` until it finishes, then finish the connection.
+        `handler` is called with each request's data and returns the response, or None to send
+        nothing back. It runs on a pool of `workers` threads (or, with `processes`, worker processes,
+        in which case it must be picklable), so requests keep being received and acknowledged while
+        others are handled. At most `max_in_flight` requests (by default, twice `workers`) are taken
+        at once, after which the rest wait, unacknowledged, until one is answered
+        """
+        free = threading.BoundedSemaphore(max_in_flight or 2 * workers)
+        def done(future: Future):
+            free.release()
+            _report_failure(future)
+        process_pool = ProcessPoolExecutor(max_workers=workers) if processes else None
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    # backpressure: don't take on a request until there's room for it
+                    free.acquire()
+                    request = self.receive_request()
+                    if request is None:
+                        break
+                    future = executor.submit(self._handle, handler, process_pool, *request)
+                    future.add_done_callback(done)
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+        try:
+            self.finish()
+        except (ClosedSocketError, OSError):
+            # the client hung up before we could finish, which ends the connection all the same
+            pass
+
+    def _handle(self, handler: Callable[[bytes], Union[None, bytes]], process_pool: Union[None, ProcessPoolExecutor],
+                correlation_id: int, data: bytes):
+        """Run the handler on a request and send its response"""
+        response = None
+        try:
+            if process_pool is None:
+                response = handler(data)
+            else:
+                response = process_pool.submit(handler, data).result()
+        finally:
+            # sent from this worker, so responses go out while other requests are being handled
+            self.send_response(correlation_id, response)
+
+    def _send_correlated(self, correlation_id: int, data: bytes):
+        """Send a request or response, prefixed with its correlation id"""
+        self._send_message(struct.pack(self.CORRELATION_FORMAT, correlation_id) + data, self.rdt.FLAGS["CORRELATED"])
+
+    def _receive_correlated(self) -> tuple[Union[None, int], bytes]:
+        """Receive a request or response, returning its correlation id (None if it had none) and data"""
+        header, payload = self._receive_message()
+        flags = header["flags"]
+        payload = self._decode(payload, flags)
+        if not flags & self.rdt.FLAGS["CORRELATED"]:
+            return None, bytes(payload)
+        (correlation_id,) = struct.unpack_from(self.CORRELATION_FORMAT, payload)
+        return correlation_id, bytes(payload[struct.calcsize(self.CORRELATION_FORMAT):])
+
+    def send_text(self, text: str, encoding: str = 'utf-8'):
+        """Convenience wrapper around send for text messages"""
+        self.send(text.encode(encoding))
+
+    def receive_text(self, encoding: str = 'utf-8') -> str:
+        """Convenience wrapper around receive for text messages"""
+        return self.receive().decode(encoding, errors='replace')
 
     def finish(self):
         """Terminate a connection"""
-        self.send("FINMSG")
-        self.transport.close()
+        self._finish_lanes()
+        # if the transport is already closed, the peer has hung up
+        if not self.transport.closed:
+            try:
+                self.flush()
+                # sent raw, as the receive FSMs look for it before any decoding
+                self.rdt.send_fsm(self.transport, b"FINMSG")
+            except (ClosedSocketError, OSError):
+                # the peer has already gone: a stream it hung up on while we were finishing,
+                # or a unix datagram socket whose file it removed when it closed
+                pass
+            self.transport.close()
+        if self.mux is not None:
+            self.mux.close()
+
+    def _finish_lanes(self):
+        """Wait for any requests in flight, then close their lanes"""
+        if self._requester is None:
+            return
+        self._requester.shutdown()
+        while True:
+            try:
+                lane = self._idle_lanes.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                lane.finish()
+            except (ClosedSocketError, OSError):
+                pass
 
 
 class ClientMessenger(Messenger):
-    def __init__(self, sock_type: str, ip: str, rdt: RDTProtocolStrategy):
-        super().__init__('client', sock_type, ip, rdt)
+    """
+    Client side Messenger. With a `pool`, the transport is taken from the pool and
+    given back to it by finish(), rather than being set up and torn down each time
+    """
+    def __init__(self, sock_type: str, ip: str, rdt: RDTProtocolStrategy,
+                 pool: Union[None, 'ConnectionPool'] = None, **kwargs):
+        super().__init__('client', sock_type, ip, rdt, **kwargs)
+        self.pool = pool
+        if pool is None:
+            self._connect()
+            return
+        port = GenericSocket.DEFAULT_PORT if self.socket_options is None else self.socket_options.port
+        # negotiated connections are kept apart, as the server expects them to start with a handshake
+        self.pool_key = (ip, port, sock_type, rdt.VERSION, self.negotiate)
+        self.transport = None
+        transport, params = pool.acquire(self.pool_key, self._connect)
+        if transport is not self.transport:
+            # an idle connection from the pool, which keeps the settings it was set up with
+            self.transport = transport
+            if params is not None:
+                self._use_params(params)
+
+    def _connect(self) -> GenericSocket:
+        """Make a new connection to the server, with a handshake if we negotiate"""
         self._get_new_sock()
+        if self.negotiate:
+            codecs = [] if self.compressor is None else [self.compressor.codec]
+            self._use_params(client_handshake(self.transport, self._handshake_params(codecs)))
+        return self.transport
+
+    def _send_message(self, data: bytes, flags: int = 0x00):
+        try:
+            super()._send_message(data, flags)
+        except (ClosedSocketError, ConnectionError):
+            if self.pool is None:
+                raise
+            if self.mux is not None:
+                # its streams went with the connection, so there's nothing to carry on over
+                self.mux.close()
+                raise
+            # the server may have dropped a pooled connection, so try once more on a new one
+            self.pool.discard(self.transport, self.rdt)
+            self._connect()
+            super()._send_message(data, flags)
+
+    def finish(self):
+        """
+        End the session. A pooled connection is given back to the pool rather than closed,
+        unless it was multiplexed, as the next session wouldn't know of its streams
+        """
+        if self.pool is None or self.mux is not None:
+            return super().finish()
+        self._finish_lanes()
+        self.flush()
+        self.pool.release(self.pool_key, self.transport, self.rdt, self.params)
 
 class ServerMessenger(Messenger):
-    def __init__(self, sock_type: str, ip: str, rdt: RDTProtocolStrategy):
-        super().__init__('server', sock_type, ip, rdt)
+    def __init__(self, sock_type: str, ip: str, rdt: RDTProtocolStrategy, **kwargs):
+        super().__init__('server', sock_type, ip, rdt, **kwargs)
         self._get_new_sock()
+
+class ConnectionPool():
+    """
+    Client transports kept open between sessions, keyed by (ip, port, sock_type, rdt version,
+    negotiate), so the cost of connecting is paid once per server rather than once per session.
+    Each is kept with the settings agreed in its handshake, if it had one.
+
+    A connection is checked with healthy() before it is handed out again, and
+    closed once it has been idle for `idle_timeout` seconds, or if `max_idle`
+    connections to its server are already idle. Closing one sends the server a
+    FINMSG, as finish() would have done. The pool can be shared between threads
+    """
+
+    """Default time (in seconds) an idle connection is kept open"""
+    DEFAULT_IDLE_TIMEOUT = 60.0
+    """Default number of idle connections kept for each server"""
+    DEFAULT_MAX_IDLE = 4
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT, max_idle: int = DEFAULT_MAX_IDLE):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        # idle connections for each key, most recently released last
+        self.idle: dict[tuple, deque[tuple[GenericSocket, RDTProtocolStrategy, Union[None, ConnectionParams], float]]] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: tuple, connect: Callable[[], GenericSocket]) -> tuple[GenericSocket, Union[None, ConnectionParams]]:
+        """
+        Take an idle connection for `key`, or make one with `connect` if there's none that is usable.
+        Returns the connection and its agreed settings, which are None for a new connection
+        """
+        self.evict_idle()
+        while True:
+            with self.lock:
+                connections = self.idle.get(key)
+                if not connections:
+                    break
+                transport, rdt, params, _ = connections.pop()
+            if transport.healthy():
+                return transport, params
+            self.discard(transport, rdt)
+        return connect(), None
+
+    def release(self, key: tuple, transport: GenericSocket, rdt: RDTProtocolStrategy,
+                params: Union[None, ConnectionParams] = None):
+        """Give a connection back to the pool once a session is finished with it"""
+        if not transport.healthy():
+            self.discard(transport, rdt)
+            return
+        with self.lock:
+            connections = self.idle.setdefault(key, deque())
+            connections.append((transport, rdt, params, time.monotonic()))
+            surplus = connections.popleft() if len(connections) > self.max_idle else None
+        if surplus is not None:
+            self.discard(*surplus[:2])
+        self.evict_idle()
+
+    def discard(self, transport: GenericSocket, rdt: RDTProtocolStrategy):
+        """Close a connection that won't be reused, telling the server if it's still there"""
+        if transport.closed:
+            return
+        try:
+            rdt.send_fsm(transport, b"FINMSG")
+        except (ClosedSocketError, OSError):
+            # the server has already gone, so there's no one to tell
+            pass
+        transport.close()
+
+    def evict_idle(self):
+        """Close any connections that have been idle for longer than idle_timeout"""
+        expired = []
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for key, connections in list(self.idle.items()):
+                while connections and connections[0][3] < cutoff:
+                    expired.append(connections.popleft())
+                if not connections:
+                    del self.idle[key]
+        for transport, rdt, _, _ in expired:
+            self.discard(transport, rdt)
+
+    def close(self):
+        """Close every idle connection"""
+        with self.lock:
+            idle = [c for connections in self.idle.values() for c in connections]
+            self.idle.clear()
+        for transport, rdt, _, _ in idle:
+            self.discard(transport, rdt)
+
+
+class SessionMessenger(Messenger):
+    """A Messenger for a transport that is already set up, such as a session accepted by a MessengerServer"""
+    def __init__(self, sock_type: str, ip: str, rdt: RDTProtocolStrategy, transport: GenericSocket, **kwargs):
+        super().__init__('server', sock_type, ip, rdt, **kwargs)
+        self.transport = transport
+
+
+class MessengerServer():
+    """
+    Accepts clients on one port and runs `handler` on a SessionMessenger for each.
+    `rdt_factory` is called to make each session's RDT strategy, and any other
+    keyword arguments are passed to each SessionMessenger.
+
+    At most `workers` clients are served at once. Further clients aren't accepted
+    until a worker is free, so they wait in the listen backlog (tcp) or with their
+    datagrams queued (udp). With `processes`, stream (tcp or unix) clients are
+    served in worker processes rather than threads, which suits CPU heavy handlers
+    or codecs. The handler, RDT strategy and keyword arguments must then be picklable
+    """
+
+    """Default number of clients served at once"""
+    DEFAULT_WORKERS = 8
+
+    def __init__(self, sock_type: str, ip: str, rdt_factory: Callable[[], RDTProtocolStrategy],
+                 handler: Callable[[SessionMessenger], None], workers: int = DEFAULT_WORKERS,
+                 processes: bool = False, socket_options: Union[None, SocketOptions] = None, **kwargs):
+        listener_class = SocketFactory.new_socket('server', sock_type)
+        stream = issubclass(listener_class, ServerTCPSocket)
+        if processes and not stream:
+            raise ValueError("Only stream (tcp or unix) clients can be served from worker processes")
+        self.sock_type = sock_type
+        self.ip = ip
+        self.rdt_factory = rdt_factory
+        self.handler = handler
+        self.processes = processes
+        self.messenger_kwargs = kwargs
+        if stream:
+            self.listener = listener_class(ip, wait_for_client=False, options=socket_options)
+        else:
+            self.listener = listener_class(ip, options=socket_options)
+
+        self.free_workers = threading.BoundedSemaphore(workers)
+        self.executor: Executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+
+    def serve_forever(self):
+        """Accept clients until the listening socket is closed, handing each to a worker"""
+        while True:
+            # backpressure: don't take on a client until there's a worker to serve it
+            self.free_workers.acquire()
+            try:
+                transport = self.listener.accept()
+            except ClosedSocketError:
+                self.free_workers.release()
+                return
+
+            if self.processes:
+                future = self.executor.submit(_serve_connection, self.handler, self.sock_type, self.ip,
+                                              self.rdt_factory(), transport.sock, transport.binding, transport.options,
+                                              self.messenger_kwargs)
+                # the worker process gets its own copy of the connection, so ours is closed once it's done
+                future.add_done_callback(lambda _, transport=transport: transport.close())
+            else:
+                m = SessionMessenger(self.sock_type, self.ip, self.rdt_factory(), transport, **self.messenger_kwargs)
+                future = self.executor.submit(_run_session, self.handler, m)
+            future.add_done_callback(lambda _: self.free_workers.release())
+
+    def close(self):
+        """Stop accepting clients. Sessions still running are left to finish"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.listener.close()
+
+
+def _report_failure(future: Future):
+    """Print the error from a serve() handler that raised one, as there's no caller to raise it to"""
+    if future.exception() is not None:
+        print("Request handler failed:", repr(future.exception()))
+
+def _run_session(handler: Callable[[SessionMessenger], None], m: SessionMessenger):
+    """Run a MessengerServer handler on one client, closing its transport afterwards"""
+    try:
+        handler(m)
+    except ClosedSocketError:
+        # the client or server went away, there's nothing left to do for this session
+        pass
+    except HandshakeError as e:
+        print("Handshake failed:", e)
+    finally:
+        if not m.transport.closed:
+            m.transport.close()
+        if m.mux is not None:
+            m.mux.close()
+
+def _serve_connection(handler: Callable[[SessionMessenger], None], sock_type: str, ip: str, rdt: RDTProtocolStrategy,
+                      conn: socket.socket, peer: tuple, socket_options: SocketOptions, messenger_kwargs: dict):
+    """
+    Entry point in a MessengerServer worker process, which is passed the accepted
+    connection. The server's socket options are set again on the worker's copy of it
+    """
+    transport = TCPConnection(conn, peer, socket_options)
+    _run_session(handler, SessionMessenger(sock_type, ip, rdt, transport, **messenger_kwargs))
@@ -0,0 +1,275 @@
+"""
+Microbenchmarks of the hot functions in the stack, with stored baselines.
+
+Each benchmark times one call of a function (the bit conversions, checksums,
+parity checks, corruption, header packing and parsing, packet splitting for
+each RDT version, and a loopback round trip for each RDT version), at several
+payload sizes. A benchmark is run enough times that each sample takes at least
+--min_time seconds, and --repeats samples are taken.
+
+`--save PATH` stores the results as a JSON baseline. `--compare PATH` runs the
+benchmarks again and tests each against the baseline with Welch's t-test. A
+benchmark that is more than --threshold slower, with p below --alpha, is flagged
+as a regression, and the script then exits with status 1 so it can gate merges.
+
+    python3 microbench.py --save baseline.json
+    python3 microbench.py --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, ContextManager, Iterator
+
+import messenger
+import rdt_functionality
+import rdt_protocol
+import type_manipulation
+from rdt_protocol import RDTFactory
+from transport import GenericSocket, SocketOptions
+
+"""Default payload sizes (in bytes) the benchmarks are run at"""
+DEFAULT_SIZES = [64, 1024]
+"""Default number of samples taken of each benchmark"""
+DEFAULT_REPEATS = 20
+"""Default least time (in seconds) each sample takes"""
+DEFAULT_MIN_TIME = 0.02
+"""Default significance level below which a change counts"""
+DEFAULT_ALPHA = 0.01
+"""Default slow down (as a fraction of the baseline) that counts as a regression"""
+DEFAULT_THRESHOLD = 0.10
+
+
+@contextlib.contextmanager
+def _call(function: Callable, *args) -> Iterator[Callable[[], None]]:
+    """A benchmark of one call of `function` with `args`"""
+    yield lambda: function(*args)
+
+@contextlib.contextmanager
+def _roundtrip(version: str, size: int, port: int) -> Iterator[Callable[[], None]]:
+    """A benchmark of sending a message to an echo server over loopback UDP and receiving it back"""
+    options = SocketOptions(port=port)
+    server = messenger.ServerMessenger('udp', 'localhost', RDTFactory.create(version, 0, 1, 0), socket_options=options)
+    def echo():
+        while (data := server.receive()) not in (b"FINMSG", b""):
+            server.send(data)
+        server.transport.close()
+    thread = threading.Thread(target=echo, daemon=True)
+    thread.start()
+    client = messenger.ClientMessenger('udp', 'localhost', RDTFactory.create(version, 0, 1, 0), socket_options=options)
+    data = random.randbytes(size)
+    try:
+        yield lambda: (client.send(data), client.receive())
+    finally:
+        client.finish()
+        thread.join()
+
+
+def benchmarks(sizes: list[int], port: int) -> dict[str, Callable[[], ContextManager[Callable[[], None]]]]:
+    """Every benchmark, by name"""
+    out = {}
+    for size in sizes:
+        data = random.randbytes(size)
+        bits = type_manipulation.bytes2Bin(data)
+        checksum = rdt_functionality.generateUDPChecksum(data)
+        parity = rdt_functionality.generate2DParityCheck(data)
+        packet = b"HEADER\n" + data
+        out.update({
+            f"bytes2Bin[{size}]": lambda data=data: _call(type_manipulation.bytes2Bin, data),
+            f"bin2Bytes[{size}]": lambda bits=bits: _call(type_manipulation.bin2Bytes, bits),
+            f"generateUDPChecksum[{size}]": lambda data=data: _call(rdt_functionality.generateUDPChecksum, data),
+            f"verifyUDPChecksum[{size}]": lambda data=data, checksum=checksum:
+                _call(rdt_functionality.verifyUDPChecksum, data, checksum),
+            f"generate2DParityCheck[{size}]": lambda data=data: _call(rdt_functionality.generate2DParityCheck, data),
+            f"verify2DParityCheck[{size}]": lambda data=data, parity=parity:
+                _call(rdt_functionality.verify2DParityCheck, data, parity),
+            f"corrupt[{size}]": lambda data=data: _call(rdt_functionality.corrupt, data, 1),
+            f"burstError[{size}]": lambda data=data: _call(rdt_functionality.burstError, data, 8),
+            # an error probability of 100 corrupts every packet
+            f"corruptPkt[{size}]": lambda packet=packet: _call(rdt_functionality.corruptPkt, packet, 1, 100, 0),
+        })
+
+    for version in RDTFactory.VERSIONS:
+        rdt = RDTFactory.create(version, 0, 1, 0)
+        header = bytes(rdt._split_data_into_packets(b"x" * rdt.PACKET_DATA_LEN)[0]).split(b'\n', 1)[0].decode('ascii')
+        params = rdt._parse_header(header)
+        out[f"_create_header[{version}]"] = lambda rdt=rdt, params=params: _call(rdt._create_header, params)
+        out[f"_parse_header[{version}]"] = lambda rdt=rdt, header=header: _call(rdt._parse_header, header)
+        for size in sizes:
+            data = random.randbytes(size)
+            out[f"_split_data_into_packets[{version},{size}]"] = lambda rdt=rdt, data=data: \
+                _call(rdt._split_data_into_packets, data)
+
+    for version in RDTFactory.VERSIONS:
+        for size in sizes:
+            out[f"roundtrip[{version},{size}]"] = lambda version=version, size=size, port=port + len(out): \
+                _roundtrip(version, size, port)
+    return out
+
+
+def measure(function: Callable[[], None], repeats: int, min_time: float) -> list[float]:
+    """Time `function`, returning `repeats` samples of the seconds one call takes"""
+    # find how many calls make a sample long enough for the clock's resolution not to matter
+    number = 1
+    while True:
+        elapsed = _time(function, number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, math.ceil(min_time / elapsed)))
+    return [_time(function, number) / number for _ in range(repeats)]
+
+def _time(function: Callable[[], None], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+def summarise(samples: list[float]) -> dict:
+    return {"mean": statistics.fmean(samples), "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "min": min(samples), "n": len(samples)}
+
+
+def welch(a: dict, b: dict) -> float:
+    """The two-sided p-value of Welch's t-test that summaries `a` and `b` have the same mean"""
+    var_a = a["stdev"] ** 2 / a["n"]
+    var_b = b["stdev"] ** 2 / b["n"]
+    if var_a + var_b == 0:
+        return 1.0 if a["mean"] == b["mean"] else 0.0
+    t = (a["mean"] - b["mean"]) / math.sqrt(var_a + var_b)
+    # the Welch-Satterthwaite degrees of freedom
+    df = (var_a + var_b) ** 2 / (var_a ** 2 / (a["n"] - 1) + var_b ** 2 / (b["n"] - 1))
+    # P(|T| > t) for Student's t distribution with df degrees of freedom
+    return _betainc(df / 2, 0.5, df / (df + t * t))
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """The regularised incomplete beta function I_x(a, b)"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    # the continued fraction converges quickly on this side, so use the symmetry otherwise
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1 - front * _betacf(b, a, 1 - x) / b
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction for the incomplete beta function, by the modified Lentz method"""
+    tiny = 1e-300
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1) < 1e-12:
+            break
+    return h
+
+
+def run(names: dict[str, Callable[[], ContextManager[Callable[[], None]]]], repeats: int, min_time: float) -> dict[str, dict]:
+    results = {}
+    for i, (name, benchmark) in enumerate(names.items()):
+        # the FSMs and sockets print as they go, which would be timed too
+        with contextlib.redirect_stdout(io.StringIO()), benchmark() as function:
+            results[name] = summarise(measure(function, repeats, min_time))
+        print(f"{i + 1} of {len(names)} benchmarks done", file=sys.stderr)
+    return results
+
+def compare(baseline: dict[str, dict], current: dict[str, dict], alpha: float, threshold: float) -> list[dict]:
+    """Compare each benchmark in both runs, saying whether it has significantly regressed or improved"""
+    rows = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append({"name": name, "current": now["mean"], "verdict": "new"})
+            continue
+        change = now["mean"] / before["mean"] - 1
+        p = welch(before, now)
+        if p < alpha and change > threshold:
+            verdict = "REGRESSION"
+        elif p < alpha and change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = "same"
+        rows.append({"name": name, "baseline": before["mean"], "current": now["mean"], "change": change, "p": p,
+                     "verdict": verdict})
+    return rows
+
+def print_results(results: dict[str, dict]):
+    width = max(len(name) for name in results)
+    print(f"{'benchmark'.ljust(width)}  {'mean us':>12}  {'stdev us':>10}  {'min us':>12}")
+    for name, r in results.items():
+        print(f"{name.ljust(width)}  {r['mean'] * 1e6:12.2f}  {r['stdev'] * 1e6:10.2f}  {r['min'] * 1e6:12.2f}")
+
+def print_comparison(rows: list[dict]):
+    width = max(len(r["name"]) for r in rows)
+    print(f"{'benchmark'.ljust(width)}  {'baseline us':>12}  {'current us':>12}  {'change':>8}  {'p':>8}  verdict")
+    for r in rows:
+        if "baseline" not in r:
+            print(f"{r['name'].ljust(width)}  {'-':>12}  {r['current'] * 1e6:12.2f}  {'-':>8}  {'-':>8}  {r['verdict']}")
+            continue
+        print(f"{r['name'].ljust(width)}  {r['baseline'] * 1e6:12.2f}  {r['current'] * 1e6:12.2f}  "
+              f"{r['change']:+8.1%}  {r['p']:8.2g}  {r['verdict']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Microbenchmark the hot functions, and compare them with a baseline")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help='Payload sizes in bytes (default: %(default)s)')
+    parser.add_argument('--filter', default=None,
+                        help='Only run the benchmarks whose names contain this')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='Samples taken of each benchmark (default: %(default)s)')
+    parser.add_argument('--min_time', type=float, default=DEFAULT_MIN_TIME,
+                        help='Least time in seconds each sample takes (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=GenericSocket.DEFAULT_PORT + 200,
+                        help='First port for the round trip benchmarks (default: %(default)s)')
+    parser.add_argument('--save', default=None, metavar='PATH',
+                        help='Save the results to this JSON baseline')
+    parser.add_argument('--compare', default=None, metavar='PATH',
+                        help='Compare the results with this JSON baseline, exiting with status 1 on a regression')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+                        help='Significance level for the comparison (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slow down, as a fraction, that counts as a regression (default: %(default)s)')
+    args = parser.parse_args()
+    if args.repeats < 2:
+        parser.error("--repeats must be at least 2, for the comparison's variance")
+
+    # the same payloads and corruptions every run
+    random.seed(rdt_functionality.SEED)
+    rdt_protocol.VERBOSE = False
+    rdt_protocol.RDTProtocol_v3.SIMULATED_DELAY = (0, 0)
+
+    names = benchmarks(args.sizes, args.port)
+    if args.filter is not None:
+        names = {name: b for name, b in names.items() if args.filter in name}
+    results = run(names, args.repeats, args.min_time)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "time": time.strftime('%Y-%m-%dT%H:%M:%S'), "sizes": args.sizes, "results": results}, f, indent=2)
+
+    if args.compare is None:
+        print_results(results)
+    else:
+        with open(args.compare) as f:
+            rows = compare(json.load(f)["results"], results, args.alpha, args.threshold)
+        print_comparison(rows)
+        if any(r["verdict"] == "REGRESSION" for r in rows):
+            sys.exit(1)
@@ -0,0 +1,114 @@
+"""
+Profiling for simple_client.py and simple_server.py (their --profile option).
+
+start() turns on the timing points in the RDT FSMs (rdt_protocol.TIMING) and
+starts one of two profilers:
+    - cprofile: the standard deterministic profiler, written as a pstats file
+      (read it with `python3 -m pstats PATH`). It only sees the main thread
+    - sample: every SAMPLE_INTERVAL seconds, the stack of every thread is
+      recorded. These are written as collapsed stacks, one `frame;frame;... count`
+      line per distinct stack, which flamegraph.pl and speedscope can draw
+
+When the script exits, the profile is written and the time spent in each FSM
+state (waiting for an ACK, verifying checksums, building replies, RDT 3.0's
+simulated delay, printing...) is printed as a table.
+"""
+
+import atexit
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import rdt_protocol
+
+"""Seconds between the sampling profiler's samples"""
+SAMPLE_INTERVAL = 0.001
+"""The profilers start() accepts"""
+PROFILERS = ('cprofile', 'sample')
+
+
+class SamplingProfiler():
+    """Samples the stacks of every other thread from a background thread"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        # collapsed stack -> number of times it was sampled
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """A stack as `thread;outermost frame;...;innermost frame`"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join([thread_name] + frames[::-1])
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def print_state_times(file=sys.stderr):
+    """Print how long was spent in each FSM state, longest first"""
+    times = sorted(rdt_protocol.STATE_TIMES.items(), key=lambda item: item[1][0], reverse=True)
+    if not times:
+        print("No FSM states were timed", file=file)
+        return
+    total = sum(ns for ns, _ in rdt_protocol.STATE_TIMES.values())
+    width = max(len("state"), max(len(state) for state, _ in times))
+    print(f"{'state'.ljust(width)}  {'total ms':>10}  {'count':>7}  {'mean us':>9}  {'share':>6}", file=file)
+    for state, (ns, count) in times:
+        print(f"{state.ljust(width)}  {ns / 1e6:10.2f}  {count:7d}  {ns / count / 1e3:9.1f}  {ns / total:6.1%}",
+              file=file)
+
+
+def start(path: str, profiler: str = 'cprofile'):
+    """
+    Profile the rest of the run, writing the profile to `path` and printing
+    the FSM state times when the interpreter exits
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler}")
+    rdt_protocol.TIMING = True
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+    else:
+        profile = SamplingProfiler()
+        profile.start()
+    started = time.perf_counter()
+
+    def finish():
+        if profiler == 'cprofile':
+            profile.disable()
+            profile.dump_stats(path)
+        else:
+            profile.stop()
+            profile.write(path)
+        print(f"Wrote {profiler} profile of {time.perf_counter() - started:.2f}s to {path}", file=sys.stderr)
+        print_state_times()
+
+    atexit.register(finish)
@@ -9,22 +9,22 @@ SEED =              1083430
 FAIL =              True
 SUCCESS =           False
 
-def corruptPkt(msg: str, numCorrupts=0, error_prob=0, burst=0):
-    # This function takes a message string of a packet which contains a header
+def corruptPkt(msg: bytes, numCorrupts=0, error_prob=0, burst=0):
+    # This function takes the bytes of a packet which contains a header
     # and a payload, the number of bits of the payload that should be corrupted, 
     # the probability of corruption, and the length of the burst error if
     # the corruption should be a burst error instead of random bit errors. 
     # It separates the information and the 
     # payload, uses the corrupt() function to corrupt the payload and returns 
-    # a new message string with the header and corrupted payload.
+    # a new packet with the header and corrupted payload.
 
     if random.randint(0,100) <= error_prob:
-        [header, payload] = msg.split('\n', 1)
+        [header, payload] = bytes(msg).split(b'\n', 1)
         if not burst:
-            corruptPayload = corrupt(payload.encode('utf-8'), numCorrupts)
+            corruptPayload = corrupt(payload, numCorrupts)
         else:
-            corruptPayload = burstError(payload.encode('utf-8'), burst)
-        corruptPkt = header + '\n' + str(corruptPayload).strip("b'")
+            corruptPayload = burstError(payload, burst)
+        corruptPkt = header + b'\n' + corruptPayload
         return corruptPkt
     else:
         return msg
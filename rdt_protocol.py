@@ -1,5 +1,6 @@
-import select
+import threading
 import time
+from collections import deque
 from math import ceil
 from typing import Union
 
@@ -9,49 +10,127 @@ from transport import GenericSocket
 from random import randint
 
 REJECT_FIRST_TIME_FLAG = False
+# print what the FSMs are doing. Turned off for benchmarking, as printing every packet dominates the run time
+VERBOSE = True
+
+# time each state of the FSMs, for profiling.py. Off by default, when the timing points cost next to nothing
+TIMING = False
+# per state, [total nanoseconds spent in it, number of times it was timed], gathered while TIMING is on
+STATE_TIMES: dict[str, list[int]] = {}
+_state_times_lock = threading.Lock()
+# nanoseconds each thread has spent printing, which is taken out of the state it happened in
+_log_clock = threading.local()
+
+def _log(*args):
+    if not VERBOSE:
+        return
+    if not TIMING:
+        print(*args)
+        return
+    start = time.perf_counter_ns()
+    print(*args)
+    spent = time.perf_counter_ns() - start
+    _log_clock.ns = getattr(_log_clock, "ns", 0) + spent
+    _add_state_time("log", spent)
+
+def _now() -> int:
+    """The time a state starts, for _lap(). Time spent in _log() is left out"""
+    if not TIMING:
+        return 0
+    return time.perf_counter_ns() - getattr(_log_clock, "ns", 0)
+
+def _lap(state: str, start: int) -> int:
+    """End `state`, which started at `start`, and return the start of the next one"""
+    if not TIMING:
+        return 0
+    now = _now()
+    _add_state_time(state, now - start)
+    return now
+
+def _add_state_time(state: str, ns: int):
+    with _state_times_lock:
+        times = STATE_TIMES.setdefault(state, [0, 0])
+        times[0] += ns
+        times[1] += 1
 
 class RDTProtocolStrategy():
     """Different protocols use the Strategy pattern"""
 
-    FLAGS = {"ACK": 0x01, "FIN": 0x02, "NACK": 0x04}
+    """RDT version implemented, as given to RDTFactory.create"""
+    VERSION: Union[None, str] = None
+
+    FLAGS = {"ACK": 0x01, "FIN": 0x02, "NACK": 0x04, "BATCH": 0x08, "CORRELATED": 0x40, "SYN": 0x80}
+    # two bits of the flags say which codec, if any, the message was compressed with
+    CODEC_FLAGS = {"zlib": 0x10, "lzma": 0x20, "bz2": 0x30}
+    CODEC_MASK = 0x30
     PACKET_DATA_LEN = 20 # bytes (needs to be at least 3 bytes so ACK or NAK is in one packet)
     N_FLAG_HEXS  = 2
     N_SEQ_DIGITS = 4
     N_CHECKSUM_CHARS = rdt_functionality.BYTE_SIZE
     N_ERROR_CORRECTION_CHARS = (PACKET_DATA_LEN + 1) * rdt_functionality.BYTE_SIZE
     N_PKT_NUM_DIGITS = 1
+    N_STREAM_DIGITS = 4
     RECV_TIMEOUT = 2 # seconds
+    MAX_HEADER_LEN = 128 # bytes, the most we search for the end of a header
+    RECV_BATCH_LEN = 64 # packets, the most taken off the socket in one go by batched receives
 
     def __init__(self, error_prob: float, error_num: int, burst: int):
         self.error_prob = error_prob
         self.error_num = error_num
         self.burst = burst
-
-    def send_fsm(self, socket: GenericSocket, data: str):
+        # most packets sent before waiting on the receiver, None for no limit. Set by the handshake
+        self.window: Union[None, int] = None
+        # the stream our packets are tagged with when several share a connection, None for untagged
+        self.stream_id: Union[None, int] = None
+        # counts of what we've sent, for benchmarking
+        self.stats = {"packets_sent": 0, "bytes_sent": 0, "resent": 0}
+
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
         """
-        send data using the RDT protocol
+        send data using the RDT protocol, with `flags` set on every data packet
         """
         raise NotImplementedError()
 
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
         """
-        Run the RDT protocol's receive FSM. Returns data in the form
-        [
-            (header1, data1),
-            (header2, data2),
-            ...
-            (headerN, dataN)
-        ]
+        Run the RDT protocol's receive FSM. Returns the header of the message's
+        first packet (for its flags) and the message. Each packet's data is
+        written straight to its place in the message as it arrives, into
+        `buffer` if one is given or else a buffer of the FSM's own, and the
+        message is a view of that buffer. A FINMSG is handed back as bytes
+        instead, without being written to the buffer
         """
         raise NotImplementedError()
 
+    def has_pending(self) -> bool:
+        """True if packets have already been taken off the socket for the next recv_fsm()"""
+        return False
+
 
-    def _split_data_into_packets(self, data: str, flags: int = 0x00) -> list[str]:
+    def _split_data_into_packets(self, data: bytes, flags: int = 0x00) -> list[bytes]:
         """
         Split up a message by size
         This does the make_pkt() functionality
         """
+        return [b''.join(parts) for parts in self._split_data_into_parts(data, flags)]
+
+    def _send(self, socket: GenericSocket, packet: bytes, resend: bool = False):
+        """Send a packet, counting it in our stats. `resend` is True for a retransmission"""
+        socket.send(packet)
+        self.stats["packets_sent"] += 1
+        self.stats["bytes_sent"] += len(packet)
+        if resend:
+            self.stats["resent"] += 1
+
+    def _split_data_into_parts(self, data: bytes, flags: int = 0x00) -> list[tuple[bytes, memoryview]]:
+        """
+        Split up a message by size, leaving each packet as its header line and
+        a view of its payload, so they can be sent with socket.send_many()
+        without joining them
+        """
         packet_list = []
+        # slicing a memoryview doesn't copy the payload
+        data = memoryview(data)
         n_packets = ceil(len(data) / self.PACKET_DATA_LEN)
 
         for i in range(n_packets):
@@ -59,16 +138,15 @@ class RDTProtocolStrategy():
             next_data = data[data_idx:min(data_idx+self.PACKET_DATA_LEN, len(data))]
 
             # seq = i+1 means that seq of last packet == total
-            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data.encode('utf-8')))
+            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data))
             header_params = {"seq": i+1, "total": n_packets, "flags": flags, "check": checksum}
             header = self._create_header(header_params)
-            next_packet = header + '\n' + next_data
-            packet_list.append(next_packet)
+            packet_list.append((header.encode() + b'\n', next_data))
 
         return packet_list
 
 
-    def _extract(self, packet: str) -> tuple[dict[str, any], str]:
+    def _extract(self, packet: bytes) -> tuple[dict[str, any], memoryview]:
         """
         Parse a received packet into its params and data
         This is the extract() function
@@ -78,6 +156,31 @@ class RDTProtocolStrategy():
         return params, data
 
 
+    def _receive_packet(self, socket: GenericSocket) -> tuple[dict[str, any], bytes]:
+        """
+        Receive and extract a packet. The socket's buffer goes back to its pool
+        as soon as the header is parsed, so only the payload is copied out
+        """
+        view = socket.receive_view()
+        try:
+            header, data = self._extract(view)
+            return header, bytes(data)
+        finally:
+            socket.release(view)
+
+    def _receive_packets(self, socket: GenericSocket) -> list[tuple[dict[str, any], bytes]]:
+        """
+        Like _receive_packet(), but takes every packet that is already waiting on
+        the socket (at least one, and up to RECV_BATCH_LEN) in one go
+        """
+        views = socket.receive_many(self.RECV_BATCH_LEN)
+        try:
+            return [(header, bytes(data)) for header, data in map(self._extract, views)]
+        finally:
+            for view in views:
+                socket.release(view)
+
+
     # OVERRIDE IN CHILD 
     def _parse_header(self, header: str) -> dict[str, int]:
         """Take a header string and parse out the seq num, flags, (any other data we add in the future)"""
@@ -88,7 +191,7 @@ class RDTProtocolStrategy():
         total = int(header[i+len('T:'):i+self.N_SEQ_DIGITS+len('T:')])
 
         i = header.index('F:')
-        flags = int(header[i+len('F:'):i+self.N_FLAG_HEXS+len('F:')])
+        flags = int(header[i+len('F:'):i+self.N_FLAG_HEXS+len('F:')], 16)
 
         i = header.index('C:')
         checksum = header[i+len('C:'):i+self.N_CHECKSUM_CHARS+len('C:')]
@@ -101,7 +204,7 @@ class RDTProtocolStrategy():
         Create the procotol header for given params
         Current params: `seq`, `flags`, `check`
         """
-        print("MSG: _create_header: params:",params)
+        _log("MSG: _create_header: params:",params)
         if not 'seq' in params:
             raise ValueError("Missing sequence number (key: 'seq')")
         if not (0 <= params["seq"] <= 9999):
@@ -116,23 +219,125 @@ class RDTProtocolStrategy():
             raise ValueError(f"Flags out of range: {params['flags']}")
         if not 'check' in params:
             raise ValueError("Missing checksum (key: 'check')")
-        return f"HEADER S:{params['seq']:04d} T:{params['total']:04d} F:{params['flags']:02x} C:{params['check'][0:self.N_CHECKSUM_CHARS]}"
-
-    def __get_header_data_split(self, buffer: str) -> tuple[str, str]:
-        """Split a received buffer into header and data components"""
-        try:
-            header_end = buffer.index('\n')
-            header = buffer[:header_end]
+        return f"HEADER S:{params['seq']:04d} T:{params['total']:04d} F:{params['flags']:02x} C:{params['check'][0:self.N_CHECKSUM_CHARS]}" + self._stream_field()
+
+    def _stream_field(self) -> str:
+        """The header field giving our stream, if we have one"""
+        if self.stream_id is None:
+            return ""
+        if not (0 <= self.stream_id <= 9999):
+            raise ValueError(f"Stream id out of range: {self.stream_id}")
+        return f" I:{self.stream_id:04d}"
+
+    @classmethod
+    def stream_of(cls, packet: bytes) -> int:
+        """The stream a received packet belongs to, read from its header. Untagged packets are stream 0"""
+        start = bytes(memoryview(packet)[:cls.MAX_HEADER_LEN])
+        end = start.find(b'\n')
+        header = start if end == -1 else start[:end]
+        i = header.find(b' I:')
+        if i == -1:
+            return 0
+        return int(header[i+len(' I:'):i+len(' I:')+cls.N_STREAM_DIGITS])
+
+    def __get_header_data_split(self, buffer: bytes) -> tuple[str, memoryview]:
+        """
+        Split a received buffer into header and data components.
+        The header is ASCII so it is decoded, the data is left as a view
+        into the buffer
+        """
+        buffer = memoryview(buffer)
+        # only the start of the packet is searched, as that's all the header can be
+        header_end = bytes(buffer[:self.MAX_HEADER_LEN]).find(b'\n')
+        if header_end == -1:
+            header = bytes(buffer)
+            data = memoryview(b"")
+        else:
+            header = bytes(buffer[:header_end])
             data = buffer[header_end+1:]
-        except ValueError:
-            header = buffer
-            data = ""
 
-        return header, data
+        return header.decode('ascii'), data
+
+
+class ReceiveTracker():
+    """
+    Tracks which packets of a message have arrived, using a bitmap indexed by
+    sequence number and a running count of the packets still missing.
+    Duplicate rejection and completion checks are O(1), and `next_expected`
+    gives the first gap. Each packet's data is written straight to its place
+    in a preallocated buffer, at (seq-1) * packet_len, so the message is whole
+    once the last packet arrives, without the packets being kept or joined.
+    """
+
+    def __init__(self, total: int, packet_len: int, buffer: Union[None, memoryview] = None):
+        self.total = total
+        self.missing = total
+        # bit (seq-1) is set once packet `seq` has been received
+        self.bitmap = bytearray((total + 7) // 8)
+        self.packet_len = packet_len
+        # a buffer of our own, unless the caller has one for the message (eg a view of an mmap)
+        self.buffer = bytearray(total * packet_len) if buffer is None else buffer
+        # only the first packet's header is kept, for the message's flags
+        self.header: Union[None, dict[str, any]] = None
+        # the message's length, known once its last packet (which may be short) has arrived
+        self.length = 0
+        # lowest sequence number we haven't received yet
+        self.next_expected = 1
+
+    def has(self, seq: int) -> bool:
+        """True if packet `seq` has already been received"""
+        i = seq - 1
+        return bool(self.bitmap[i >> 3] & (1 << (i & 7)))
+
+    def add(self, header: dict[str, any], data: bytes) -> bool:
+        """
+        Record a received packet. Returns False if it is a duplicate or its
+        sequence number is out of range, in which case it is dropped
+        """
+        seq = header["seq"]
+        if not (1 <= seq <= self.total) or self.has(seq):
+            return False
+        if seq < self.total and len(data) != self.packet_len:
+            # only the last packet can be another length, or the offsets would be wrong
+            raise ValueError(f"Packet #{seq} has {len(data)} bytes of data, expected {self.packet_len}. "
+                             "Do both ends use the same packet size?")
+        offset = (seq - 1) * self.packet_len
+        if offset + len(data) > len(self.buffer) and not isinstance(self.buffer, bytearray):
+            raise ValueError(f"Message doesn't fit in the {len(self.buffer)} byte buffer")
+        # a bytearray grows if the last packet is longer, as a handshake packet can be
+        self.buffer[offset:offset+len(data)] = data
+        if self.header is None:
+            self.header = dict(header)
+        if seq == self.total:
+            self.length = offset + len(data)
+
+        i = seq - 1
+        self.bitmap[i >> 3] |= 1 << (i & 7)
+        self.missing -= 1
+        while self.next_expected <= self.total and self.has(self.next_expected):
+            self.next_expected += 1
+        return True
+
+    def complete(self) -> bool:
+        """True once every packet of the message has been received"""
+        return self.missing == 0
+
+    def gaps(self) -> list[int]:
+        """Sequence numbers that haven't been received yet"""
+        return [seq for seq in range(self.next_expected, self.total + 1) if not self.has(seq)]
+
+    def message(self) -> tuple[dict[str, any], memoryview]:
+        """The first packet's header and the whole message, once complete, as a view of the buffer"""
+        # only the last packet can be short, so the view leaves off less than a packet's worth
+        return self.header, memoryview(self.buffer)[:self.length]
 
 
 class RDTFactory():
     """Get the management class corresponding to a particular RDT version"""
+
+    """Every version create() accepts"""
+    VERSIONS = ('1.0', '2.0', '2.1', '2.2', '3.0')
+
     @staticmethod
     def create(rdt_ver: str, error_prob: float, error_num: int, burst: int) -> RDTProtocolStrategy:
         if rdt_ver == '1.0':
@@ -150,138 +355,168 @@ class RDTFactory():
 
 
 class RDTProtocol_v1(RDTProtocolStrategy):
-    def send_fsm(self, socket: GenericSocket, data: str):
-        packets_to_send: list[str] = self._split_data_into_packets(data)
-        print("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
-        for packet in packets_to_send:
-            socket.send(packet)
+    VERSION = '1.0'
+    # seconds between windows, so a long message doesn't overrun the receiver's socket buffer
+    WINDOW_INTERVAL = 0.001
 
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
-        """
-        Run the RDT protocol's receive FSM. Returns data in the form
-        [
-            (header1, data1),
-            (header2, data2),
-            ...
-            (headerN, dataN)
-        ]
-        """
-        received_data_buffer = []
+    def __init__(self, error_prob: float, error_num: int, burst: int):
+        super().__init__(error_prob, error_num, burst)
+        # packets received in a batch after the end of the last message, kept for the next one
+        self.backlog: deque[tuple[dict[str, any], bytes]] = deque()
+
+    def has_pending(self) -> bool:
+        return bool(self.backlog)
+
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
+        t = _now()
+        packets_to_send: list[tuple[bytes, memoryview]] = self._split_data_into_parts(data, flags)
+        t = _lap("send:split", t)
+        if VERBOSE:
+            # only joined for printing, so not done otherwise
+            _log("MSG: SEND: will send: \033[33m", [b''.join(parts) for parts in packets_to_send], '\033[0m')
+        # v1 doesn't wait for ACKs, so a window's worth of packets goes out at a time, and as
+        # nothing says when the receiver has caught up, it's given a while to before the next
+        window = self.window or self.RECV_BATCH_LEN
+        for i in range(0, len(packets_to_send), window):
+            if i:
+                time.sleep(self.WINDOW_INTERVAL)
+            socket.send_many(packets_to_send[i:i+window])
+        _lap("send:transmit", t)
+        self.stats["packets_sent"] += len(packets_to_send)
+        self.stats["bytes_sent"] += sum(len(part) for parts in packets_to_send for part in parts)
+
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
 
         have_received_data = False
-        start_time = time.time()
+        t = _now()
         while True:
-            time.sleep(1)
-            remaining_timeout = self.RECV_TIMEOUT - (time.time() - start_time)
-            
-            more_data = select.select([socket.sock], [], [], self.RECV_TIMEOUT)
-            # this check sees if there's any more data to be read on the socket
-            # if we have read previously in this loop, then we're within the receipt state machine, and no data means we're done
-            # if we've never read anything, then we are a server pending on a new receipt from the client, and so we just keep looping
-            # print(more_data)
+            # block until there's data, then take everything that has arrived at once
+            if not self.backlog:
+                self.backlog.extend(self._receive_packets(socket))
+            header_params, data = self.backlog.popleft()
+            t = _lap("recv:wait_packet", t)
 
-            if more_data[0] or remaining_timeout > 0:
-
-                # getting here means we've received data
-                # print('more to receive')
+            if not have_received_data:
+                _log("MSG: RCV: Received Messenger comms:")
+            have_received_data = True
 
-                recv_buffer = socket.receive()
-                if not have_received_data:
-                    print("MSG: RCV: Received Messenger comms:")
-                have_received_data = True
-                header_params, data = self._extract(recv_buffer)
+            _log("Header: \033[31m" + str(header_params) + "\033[0m\nData: [\033[32m" + str(bytes(data)) + "\033[0m]\n------")
 
-                print("Header: \033[31m" + str(header_params) + "\033[0m\nData: [\033[32m" + data + "\033[0m]\n------")
+            # handed back as it is, rather than written into the caller's buffer
+            if tracker is None and header_params["total"] == 1 and data == b"FINMSG":
+                return header_params, data
 
-                received_data_buffer.append((header_params, data))
+            if tracker is None:
+                tracker = ReceiveTracker(header_params["total"], self.PACKET_DATA_LEN, buffer)
+            if not tracker.add(header_params, data):
+                _log(f"Dropping duplicate packet #{header_params['seq']}")
+            t = _lap("recv:reassemble", t)
 
-                # if we have the number of packets we need, we're done
-                if len(received_data_buffer) == received_data_buffer[0][0]["total"]:
-                    # sort the packets in order and pass up to caller
-                    return sorted(received_data_buffer, key=lambda r:r[0]["seq"])
+            # if we have every packet we need, we're done
+            if tracker.complete():
+                # the tracker has already put the packets in order
+                return tracker.message()
 
 
 class RDTProtocol_v2_0(RDTProtocolStrategy):
+    VERSION = '2.0'
 
-    def send_fsm(self, socket: GenericSocket, data: str):
-        packets_to_send: list[str] = self._split_data_into_packets(data)
-        print("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
+        t = _now()
+        packets_to_send: list[bytes] = self._split_data_into_packets(data, flags)
+        t = _lap("send:split", t)
+        _log("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
         for packet in packets_to_send:
             
-            if data == "FINMSG":
-                socket.send(packet)
+            if data == b"FINMSG":
+                self._send(socket, packet)
+                _lap("send:transmit", t)
                 return
             else:
                 corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                socket.send(corruptPkt)
+                self._send(socket, corruptPkt)
+                t = _lap("send:transmit", t)
 
             while True:
-                receipt: str = socket.receive()
-                header, data = self._extract(receipt)
+                header, data = self._receive_packet(socket)
+                t = _lap("send:wait_ack", t)
 
                 # if this condition hits, we have successful ACK
                 if header["flags"] & self.FLAGS["ACK"]:
-                    print("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
+                    _log("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
                     break
 
                 # if this condition hits, we need to re-request
                 if header["flags"] & self.FLAGS["NACK"]:
-                    print("Received a NACK, retransmitting")
+                    _log("Received a NACK, retransmitting")
                     corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                    socket.send(corruptPkt)
+                    self._send(socket, corruptPkt, resend=True)
+                    t = _lap("send:transmit", t)
                     continue
         return
 
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
-        received_data_buffer = []
-        have_received_data = False
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
 
         # This flag lets us deterministically fail the first transmission
         reject_first_time_flag = REJECT_FIRST_TIME_FLAG
 
+        t = _now()
         while True:
-            receipt = socket.receive()
-            header, data = self._extract(receipt)
+            header, data = self._receive_packet(socket)
+            t = _lap("recv:wait_packet", t)
+
+            # checking FINMSG, which isn't ACKed as the sender doesn't wait for one
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, data
             
             # fail the first transmission
             if reject_first_time_flag:
                 reject_first_time_flag = False
                 header["flags"] = self.FLAGS["NACK"]
-                print(f"\033[31mNACKing packet #{header['seq']}\033[0m")
-                socket.send(self._create_header(header))
+                _log(f"\033[31mNACKing packet #{header['seq']}\033[0m")
+                self._send(socket, self._create_header(header).encode())
+                t = _lap("recv:send_reply", t)
                 continue
 
 
             # print(list(header["check"]))
-            checksum_valid = not rdt_functionality.verifyUDPChecksum(data.encode('utf-8'), list(header["check"]))
+            checksum_valid = not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            t = _lap("recv:verify_checksum", t)
 
             # because this is RDT2.0, we make the assumption that the ACK is not affected by corruption
             if checksum_valid:
-                received_data_buffer.append((header, data))
+                if tracker is None:
+                    tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN, buffer)
+                tracker.add(header.copy(), data)
+                t = _lap("recv:reassemble", t)
                 header["flags"] = self.FLAGS["ACK"]
-                print(f"ACKing packet #{header['seq']}")
-                socket.send(self._create_header(header))
+                _log(f"ACKing packet #{header['seq']}")
+                self._send(socket, self._create_header(header).encode())
+                t = _lap("recv:send_reply", t)
             elif not checksum_valid:
                 header["flags"] = self.FLAGS["NACK"]
-                print(f"\033[31mNACKing packet #{header['seq']}\033[0m")
-                socket.send(self._create_header(header))
+                _log(f"\033[31mNACKing packet #{header['seq']}\033[0m")
+                self._send(socket, self._create_header(header).encode())
+                t = _lap("recv:send_reply", t)
                 continue
 
-            if not have_received_data:
-                expected_packets = int(header["total"])
-                have_received_data = True
-            if len(received_data_buffer) == expected_packets:
-                return sorted(received_data_buffer, key=lambda r:r[0]["seq"])
+            if tracker.complete():
+                return tracker.message()
 
 
 class RDTProtocol_v2_1(RDTProtocol_v2_0):
+    VERSION = '2.1'
 
-    def _split_data_into_packets(self, data: str, flags: int = 0x00) -> list[str]:
+    def _split_data_into_packets(self, data: bytes, flags: int = 0x00) -> list[bytes]:
         """
         Split up a message by size
         This does the make_pkt() functionality
         """
         packet_list = []
+        # slicing a memoryview doesn't copy the payload
+        data = memoryview(data)
         n_packets = ceil(len(data) / self.PACKET_DATA_LEN)
 
         for i in range(n_packets):
@@ -289,11 +524,11 @@ class RDTProtocol_v2_1(RDTProtocol_v2_0):
             next_data = data[data_idx:min(data_idx+self.PACKET_DATA_LEN, len(data))]
 
             # seq = i+1 means that seq of last packet == total
-            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data.encode('utf-8')))
+            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data))
             pkt_num = i % 2
             header_params = {"seq": i+1, "total": n_packets, "flags": flags, "check": checksum, "pkt_num": pkt_num}
             header = self._create_header(header_params)
-            next_packet = header + '\n' + next_data
+            next_packet = header.encode() + b'\n' + next_data
             packet_list.append(next_packet)
 
         return packet_list
@@ -307,7 +542,7 @@ class RDTProtocol_v2_1(RDTProtocol_v2_0):
         total = int(header[i+len('T:'):i+self.N_SEQ_DIGITS+len('T:')])
 
         i = header.index('F:')
-        flags = int(header[i+len('F:'):i+self.N_FLAG_HEXS+len('F:')])
+        flags = int(header[i+len('F:'):i+self.N_FLAG_HEXS+len('F:')], 16)
 
         i = header.index('C:')
         checksum = header[i+len('C:'):i+self.N_CHECKSUM_CHARS+len('C:')]
@@ -322,7 +557,7 @@ class RDTProtocol_v2_1(RDTProtocol_v2_0):
         Create the procotol header for given params
         Current params: `seq`, `flags`, `check`
         """
-        print("MSG: _create_header: params:",params)
+        _log("MSG: _create_header: params:",params)
         if not 'seq' in params:
             raise ValueError("Missing sequence number (key: 'seq')")
         if not (0 <= params["seq"] <= 9999):
@@ -339,102 +574,114 @@ class RDTProtocol_v2_1(RDTProtocol_v2_0):
             raise ValueError("Missing checksum (key: 'check')")
         if not 'pkt_num' in params:
             raise ValueError("Missing packet number (key: 'pkt_num)")
-        return f"HEADER S:{params['seq']:04d} T:{params['total']:04d} F:{params['flags']:02x} C:{params['check'][0:self.N_CHECKSUM_CHARS]} N:{params['pkt_num']:01d}"
+        return f"HEADER S:{params['seq']:04d} T:{params['total']:04d} F:{params['flags']:02x} C:{params['check'][0:self.N_CHECKSUM_CHARS]} N:{params['pkt_num']:01d}" + self._stream_field()
 
-    def send_fsm(self, socket: GenericSocket, data: str):
-        packets_to_send: list[str] = self._split_data_into_packets(data)
-        print("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
+        t = _now()
+        packets_to_send: list[bytes] = self._split_data_into_packets(data, flags)
+        t = _lap("send:split", t)
+        _log("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
 
         for packet in packets_to_send:
             
             # always send close messages without corrupting them
-            if data == "FINMSG":
-                socket.send(packet)
+            if data == b"FINMSG":
+                self._send(socket, packet)
+                _lap("send:transmit", t)
                 return
             
             # call to send pkt 0
             else:
                 corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                socket.send(corruptPkt)
+                self._send(socket, corruptPkt)
+                t = _lap("send:transmit", t)
 
             # wait for ACK or NAK
             while True:
-                receipt = socket.receive()
-                header, data = self._extract(receipt)
+                header, data = self._receive_packet(socket)
+                t = _lap("send:wait_ack", t)
 
                 # if this condition hits, we have successful ACK
-                if data == "ACK":
-                    print("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
+                if data == b"ACK":
+                    _log("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
                     break
 
                 # if this condition hits, we have successful NAK => need to re-request
-                elif data == "NAK":
-                    print("Received a NAK, re-sending packet")
+                elif data == b"NAK":
+                    _log("Received a NAK, re-sending packet")
                     corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                    socket.send(corruptPkt)
+                    self._send(socket, corruptPkt, resend=True)
+                    t = _lap("send:transmit", t)
 
                 # if this condition hits, we have garbled ACK/NAK => need to re-request
                 else:
-                    print("ACK/NAK was garbled, re-sending packet")
+                    _log("ACK/NAK was garbled, re-sending packet")
                     corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                    socket.send(corruptPkt)
+                    self._send(socket, corruptPkt, resend=True)
+                    t = _lap("send:transmit", t)
         return
     
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
-        received_data_buffer = []
-        have_received_data = False
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
 
         recvSeqNum = 0      # receiver sequence number
+        t = _now()
         while True:
-            receipt = socket.receive()
-            header, data = self._extract(receipt)
+            header, data = self._receive_packet(socket)
+            t = _lap("recv:wait_packet", t)
 
-            # checking FINMSG
-            if data == "FINMSG":
-                return [(header, data)]
+            # checking FINMSG, which is always sent as a one packet message
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, data
             
-            # saving expected number of packets
-            if not have_received_data:
-                expected_packets = int(header["total"])
-                have_received_data = True
+            # set up tracking for the expected number of packets
+            if tracker is None:
+                tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN, buffer)
 
             # checking corrupt
-            checksum_valid = not rdt_functionality.verifyUDPChecksum(data.encode('utf-8'), list(header["check"]))
+            checksum_valid = not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            t = _lap("recv:verify_checksum", t)
             # send NAK if corrupt
             if not checksum_valid:
-                print("Message corrupt, sending NAK")
-                reply = (self._split_data_into_packets("NAK"))[0]
+                _log("Message corrupt, sending NAK")
+                reply = (self._split_data_into_packets(b"NAK"))[0]
 
             # checking sequence number
             elif int(header["pkt_num"]) == recvSeqNum:
                 # send ACK if correct sequence number, then update sequence number
-                print("Sequence number correct, sending ACK and updating sequence number")
-                received_data_buffer.append((header, data))
-                reply = (self._split_data_into_packets("ACK"))[0]
+                _log("Sequence number correct, sending ACK and updating sequence number")
+                tracker.add(header, data)
+                t = _lap("recv:reassemble", t)
+                reply = (self._split_data_into_packets(b"ACK"))[0]
                 recvSeqNum = recvSeqNum ^ 1
 
                 # must send uncorrupted ACK on last message received; Two Generals Problem
-                if len(received_data_buffer) == expected_packets:
-                    socket.send(reply)
-                    return sorted(received_data_buffer, key=lambda r:r[0]["seq"])
+                if tracker.complete():
+                    self._send(socket, reply)
+                    _lap("recv:send_reply", t)
+                    return tracker.message()
 
             # wrong sequence number, need to re-send ACK
             else:
-                print("Sequence number incorrect, re-sending ACK")
-                reply = (self._split_data_into_packets("ACK"))[0]
+                _log("Sequence number incorrect, re-sending ACK")
+                reply = (self._split_data_into_packets(b"ACK"))[0]
             
             # sending ACK or NAK
             corruptReply = rdt_functionality.corruptPkt(reply, self.error_num, self.error_prob, self.burst)
-            socket.send(corruptReply)
+            self._send(socket, corruptReply)
+            t = _lap("recv:send_reply", t)
 
 class RDTProtocol_v2_2(RDTProtocol_v2_1):
+    VERSION = '2.2'
 
-    def _split_data_into_packets(self, data: str, flags: int = 0x00, pkt_num_start=0) -> list[str]:
+    def _split_data_into_packets(self, data: bytes, flags: int = 0x00, pkt_num_start=0) -> list[bytes]:
         """
         Split up a message by size
         This does the make_pkt() functionality
         """
         packet_list = []
+        # slicing a memoryview doesn't copy the payload
+        data = memoryview(data)
         n_packets = ceil(len(data) / self.PACKET_DATA_LEN)
 
         for i in range(n_packets):
@@ -442,116 +689,136 @@ class RDTProtocol_v2_2(RDTProtocol_v2_1):
             next_data = data[data_idx:min(data_idx+self.PACKET_DATA_LEN, len(data))]
 
             # seq = i+1 means that seq of last packet == total
-            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data.encode('utf-8')))
+            checksum = ''.join(rdt_functionality.generateUDPChecksum(next_data))
             pkt_num = (i+pkt_num_start) % 2
             header_params = {"seq": i+1, "total": n_packets, "flags": flags, "check": checksum, "pkt_num": pkt_num}
             header = self._create_header(header_params)
-            next_packet = header + '\n' + next_data
+            next_packet = header.encode() + b'\n' + next_data
             packet_list.append(next_packet)
 
         return packet_list
     
-    def send_fsm(self, socket: GenericSocket, data: str):
-        packets_to_send: list[str] = self._split_data_into_packets(data)
-        print("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
+        t = _now()
+        packets_to_send: list[bytes] = self._split_data_into_packets(data, flags)
+        t = _lap("send:split", t)
+        _log("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
 
         i = 0
         for packet in packets_to_send:
 
-            if data == "FINMSG":
-                socket.send(packet)
+            if data == b"FINMSG":
+                self._send(socket, packet)
+                _lap("send:transmit", t)
                 return
             
             # call to send pkt 0
             else:
                 corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                socket.send(corruptPkt)
+                self._send(socket, corruptPkt)
+                t = _lap("send:transmit", t)
 
                 # getting current sequence number
                 sndrSeqNum = i % 2
 
             # wait for ACK for correct pkt number
             while True:
-                receipt = socket.receive()
-                header, data = self._extract(receipt)
+                header, data = self._receive_packet(socket)
+                t = _lap("send:wait_ack", t)
 
                 # checking pkt number and successful ACK
-                if (int(header["pkt_num"]) == sndrSeqNum) and (data == "ACK"):
-                    print("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
+                if (int(header["pkt_num"]) == sndrSeqNum) and (data == b"ACK"):
+                    _log("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
                     i += 1
                     break
             
                 # ACK is corrupted or for wrong sequence number => re-send
                 else:
-                    print("ACK garbled or for wrong packet, re-sending packet")
+                    _log("ACK garbled or for wrong packet, re-sending packet")
                     corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                    socket.send(corruptPkt)
+                    self._send(socket, corruptPkt, resend=True)
+                    t = _lap("send:transmit", t)
                     continue
         return
     
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
-        received_data_buffer = []
-        have_received_data = False
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
 
         recvSeqNum = 0      # receiver sequence number
+        t = _now()
         while True:
-            receipt = socket.receive()
-            header, data = self._extract(receipt)
+            header, data = self._receive_packet(socket)
+            t = _lap("recv:wait_packet", t)
 
-            # checking FINMSG
-            if data == "FINMSG":
-                return [(header, data)]
+            # checking FINMSG, which is always sent as a one packet message
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, data
 
-            # saving expected number of packets
-            if not have_received_data:
-                expected_packets = int(header["total"])
-                have_received_data = True
+            # set up tracking for the expected number of packets
+            if tracker is None:
+                tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN, buffer)
 
             # checking corrupt
-            checksum_valid = not rdt_functionality.verifyUDPChecksum(data.encode('utf-8'), list(header["check"]))
+            checksum_valid = not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            t = _lap("recv:verify_checksum", t)
             # re-send ACK for previous packet if corrupt
             if not checksum_valid:
-                print("Message corrupt, re-sending previous ACK")
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=(recvSeqNum^1)))[0]
+                _log("Message corrupt, re-sending previous ACK")
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=(recvSeqNum^1)))[0]
 
             elif int(header["pkt_num"]) == recvSeqNum:
                 # send ACK if correct sequence number, then update sequence number
-                print("Sequence number correct, sending ACK and updating sequence number")
-                received_data_buffer.append((header, data))
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=recvSeqNum))[0]
+                _log("Sequence number correct, sending ACK and updating sequence number")
+                tracker.add(header, data)
+                t = _lap("recv:reassemble", t)
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=recvSeqNum))[0]
                 recvSeqNum = recvSeqNum ^ 1
 
                 # must send uncorrupted ACK on last message received; Two Generals Problem
-                if len(received_data_buffer) == expected_packets:
-                    socket.send(reply)
-                    return sorted(received_data_buffer, key=lambda r:r[0]["seq"])
+                if tracker.complete():
+                    self._send(socket, reply)
+                    _lap("recv:send_reply", t)
+                    return tracker.message()
                 
             # wrong sequence number, need to re-send ACK
             else:
-                print("Sequence number incorrect, re-sending ACK")
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=(recvSeqNum^1)))[0]
+                _log("Sequence number incorrect, re-sending ACK")
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=(recvSeqNum^1)))[0]
 
             # sending ACK
             corruptReply = rdt_functionality.corruptPkt(reply, self.error_num, self.error_prob, self.burst)
-            socket.send(corruptReply)
+            self._send(socket, corruptReply)
+            t = _lap("recv:send_reply", t)
 
 class RDTProtocol_v3(RDTProtocol_v2_2):
-    def send_fsm(self, socket: GenericSocket, data: str):
-        packets_to_send: list[str] = self._split_data_into_packets(data)
-        print("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
+    VERSION = '3.0'
+    # range (in whole seconds) of the random delay before the receiver replies
+    SIMULATED_DELAY = (1, 3)
+
+    def _delay_reply(self):
+        # simulates random delay (not jitter because messages will not arrive out of order)
+        time.sleep(randint(*self.SIMULATED_DELAY))
+
+    def send_fsm(self, socket: GenericSocket, data: bytes, flags: int = 0x00):
+        t = _now()
+        packets_to_send: list[bytes] = self._split_data_into_packets(data, flags)
+        t = _lap("send:split", t)
+        _log("MSG: SEND: will send: \033[33m", packets_to_send, '\033[0m')
 
         i = 0
         for packet in packets_to_send:
             
             # Don't wait for an ACK on a FINMSG, as we have the two generals problem
-            if data == "FINMSG":
-                socket.send(packet)
+            if data == b"FINMSG":
+                self._send(socket, packet)
+                _lap("send:transmit", t)
                 return
 
             # call to send pkt 0
             else:
                 corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                socket.send(corruptPkt)
+                self._send(socket, corruptPkt)
+                t = _lap("send:transmit", t)
 
                 # getting current sequence number
                 sndrSeqNum = i % 2
@@ -559,88 +826,94 @@ class RDTProtocol_v3(RDTProtocol_v2_2):
             # wait for ACK
             while True:
                 (timed_out, receipt) = self._receive_data_or_timeout(socket)
+                t = _lap("send:wait_ack", t)
 
                 if timed_out:
-                    print("Timed out waiting for ACK, re-sending packet")
+                    _log("Timed out waiting for ACK, re-sending packet")
                     need_to_rerequest = True
                 else:
-                    header, data = self._extract(receipt)
+                    header, data = receipt
 
                     # checking pkt number and successful ACK
-                    if (int(header["pkt_num"]) == sndrSeqNum) and (data == "ACK"):
-                        print("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
+                    if (int(header["pkt_num"]) == sndrSeqNum) and (data == b"ACK"):
+                        _log("Received an ACK, " + ("done" if int(header["seq"]) == int(header["total"]) else "sending next packet"))
                         i += 1
                         break
                 
                     # ACK is corrupted or for wrong sequence number => re-send
                     else:
-                        print("ACK garbled or for wrong packet, re-sending packet")
+                        _log("ACK garbled or for wrong packet, re-sending packet")
                         corruptPkt = rdt_functionality.corruptPkt(packet, self.error_num, self.error_prob, self.burst)
-                        socket.send(corruptPkt)
+                        self._send(socket, corruptPkt, resend=True)
+                        t = _lap("send:transmit", t)
                         continue
         return
 
-    def recv_fsm(self, socket: GenericSocket) -> list[tuple[str, str]]:
-        received_data_buffer = []
-        have_received_data = False
+    def recv_fsm(self, socket: GenericSocket, buffer: Union[None, memoryview] = None) -> tuple[dict[str, any], Union[bytes, memoryview]]:
+        tracker: Union[None, ReceiveTracker] = None
 
         recvSeqNum = 0      # receiver sequence number
+        t = _now()
         while True:
-            receipt = socket.receive()
-            header, data = self._extract(receipt)
+            header, data = self._receive_packet(socket)
+            t = _lap("recv:wait_packet", t)
 
-            # checking FINMSG
-            if data == "FINMSG":
-                return [(header, data)]
+            # checking FINMSG, which is always sent as a one packet message
+            if tracker is None and header["total"] == 1 and data == b"FINMSG":
+                return header, data
 
-            # saving expected number of packets
-            if not have_received_data:
-                expected_packets = int(header["total"])
-                have_received_data = True
+            # set up tracking for the expected number of packets
+            if tracker is None:
+                tracker = ReceiveTracker(int(header["total"]), self.PACKET_DATA_LEN, buffer)
 
             # checking corrupt
-            checksum_valid = not rdt_functionality.verifyUDPChecksum(data.encode('utf-8'), list(header["check"]))
+            checksum_valid = not rdt_functionality.verifyUDPChecksum(data, list(header["check"]))
+            t = _lap("recv:verify_checksum", t)
             # re-send ACK for previous packet if corrupt
             if not checksum_valid:
-                time.sleep(randint(1,3))    # simulates random delay (not jitter because messages will not arrive out of order)
-                print("Message corrupt, re-sending previous ACK")
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=(recvSeqNum^1)))[0]
+                self._delay_reply()
+                t = _lap("recv:delay", t)
+                _log("Message corrupt, re-sending previous ACK")
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=(recvSeqNum^1)))[0]
 
             elif int(header["pkt_num"]) == recvSeqNum:
                 # send ACK if correct sequence number, then update sequence number
-                time.sleep(randint(1,3))    # simulates random delay (not jitter because messages will not arrive out of order)
-                print("Sequence number correct, sending ACK and updating sequence number")
-                received_data_buffer.append((header, data))
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=recvSeqNum))[0]
+                self._delay_reply()
+                t = _lap("recv:delay", t)
+                _log("Sequence number correct, sending ACK and updating sequence number")
+                tracker.add(header, data)
+                t = _lap("recv:reassemble", t)
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=recvSeqNum))[0]
                 recvSeqNum = recvSeqNum ^ 1
 
                 # must send uncorrupted ACK on last message received; Two Generals Problem
-                if len(received_data_buffer) == expected_packets:
-                    socket.send(reply)
-                    return sorted(received_data_buffer, key=lambda r:r[0]["seq"])
+                if tracker.complete():
+                    self._send(socket, reply)
+                    _lap("recv:send_reply", t)
+                    return tracker.message()
                 
             # wrong sequence number, need to re-send ACK
             else:
-                time.sleep(randint(1,3))    # simulates random delay (not jitter because messages will not arrive out of order)
-                print("Sequence number incorrect, re-sending ACK")
-                reply = (self._split_data_into_packets("ACK", pkt_num_start=(recvSeqNum^1)))[0]
+                self._delay_reply()
+                t = _lap("recv:delay", t)
+                _log("Sequence number incorrect, re-sending ACK")
+                reply = (self._split_data_into_packets(b"ACK", pkt_num_start=(recvSeqNum^1)))[0]
 
             # sending ACK
             corruptReply = rdt_functionality.corruptPkt(reply, self.error_num, self.error_prob, self.burst)
-            socket.send(corruptReply)
+            self._send(socket, corruptReply)
+            t = _lap("recv:send_reply", t)
 
-    def _receive_data_or_timeout(self, socket: GenericSocket) -> tuple[bool, Union[None, str]]:
+    def _receive_data_or_timeout(self, socket: GenericSocket) -> tuple[bool, Union[None, tuple[dict[str, any], bytes]]]:
         """
         receive data on a link that might timeout
         - returns a tuple. The first value is True for timeout, and False for data received
         - If first value is True, then second value is None
-        - If first value is False, then second value the received data
+        - If first value is False, then second value the received (header, data)
         """
 
-        readable, _, _ = select.select([socket.sock], [], [], self.RECV_TIMEOUT)
-
         # check for timeout
-        if not readable:
+        if not socket.wait_readable(self.RECV_TIMEOUT):
             return True, None
         else:
-            return False, socket.receive()
+            return False, self._receive_packet(socket)
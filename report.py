@@ -0,0 +1,51 @@
+"""
+Printing and caching results, for the scripts that measure the protocols and
+checksums (bench.py, detection_rate.py and sweep.py).
+
+Results are printed as a table with right-aligned columns. A cache file holds
+one result per line, as JSON with the key it's cached under, so results can be
+added a line at a time as they finish. A line cut short by an interrupted run
+is skipped when the cache is loaded.
+"""
+
+import json
+import os
+from typing import TextIO
+
+
+def print_table(names: list[str], rows: list[list[str]]):
+    """Print `rows` of formatted cells under the column `names`. A row can stop short, eg with an error"""
+    widths = [max([len(name)] + [len(row[i]) for row in rows if i < len(row)]) for i, name in enumerate(names)]
+    print('  '.join(name.rjust(w) for name, w in zip(names, widths)))
+    for row in rows:
+        print('  '.join(cell.rjust(w) for cell, w in zip(row, widths)))
+
+def print_results(results: list[dict], columns: list[tuple[str, str, str]]):
+    """Print `results` as a table, with a column for each (name, key, format) of `columns`"""
+    print_table([name for name, _, _ in columns], [[fmt.format(r[key]) for _, key, fmt in columns] for r in results])
+
+
+def load_cache(path: str) -> dict[str, dict]:
+    """The results in the cache file at `path`, by key. A missing file is an empty cache"""
+    cache = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cache[result.pop("key")] = result
+    except FileNotFoundError:
+        pass
+    return cache
+
+def open_cache(path: str) -> TextIO:
+    """Open the cache file at `path` to add results to with add_to_cache()"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return open(path, 'a')
+
+def add_to_cache(f: TextIO, key: str, result: dict):
+    """Add a result to an open cache file, flushed straight away so it's kept if the run is interrupted"""
+    f.write(json.dumps({"key": key, **result}) + '\n')
+    f.flush()
@@ -5,50 +5,117 @@ It accepts socket type as an argument, which should preferrably be set to 'udp'
 The server should start first so a binding is created
 """
 
+import os
 import sys
 import argparse
 
 import messenger
+import profiling
 from rdt_protocol import RDTFactory
+from compression import Compressor, CODECS
+from transport import GenericSocket, SocketOptions, UnixSocketMixin, ClosedSocketError
+from handshake import HandshakeError
+from file_transfer import send_file, rate, LOSSY_SOCK_TYPES
 
 parser = argparse.ArgumentParser(
     description="""This script runs the client side of the communications. The server should start first so a binding is created.""")
 parser.add_argument('rdt_ver', choices=['1.0', '2.0', '2.1', '2.2', '3.0'],
                         help='RDT version (choose from: 1.0, 2.0, 2.1, 2.2, 3.0)')
-parser.add_argument('--sock_type', choices=['udp', 'tcp'], default='udp',
-                        help='Socket type (choose from: udp, tcp, default: udp)')
+parser.add_argument('--sock_type', choices=['udp', 'tcp', 'unix', 'unix-dgram'], default='udp',
+                        help='Socket type (choose from: udp, tcp, unix, unix-dgram, default: udp)')
 parser.add_argument('--ip', default='localhost',
                         help='IP address (default: localhost)')
+parser.add_argument('--path', default=UnixSocketMixin.DEFAULT_PATH,
+                        help='Socket file for the unix socket types (default: %(default)s)')
+parser.add_argument('--port', default=GenericSocket.DEFAULT_PORT, type=int,
+                        help='Port for the udp and tcp socket types (default: %(default)s)')
+parser.add_argument('--rcvbuf', default=None, type=int,
+                        help='Socket receive buffer size in bytes (default: OS default)')
+parser.add_argument('--sndbuf', default=None, type=int,
+                        help='Socket send buffer size in bytes (default: OS default)')
+parser.add_argument('--nodelay', default=True, action=argparse.BooleanOptionalAction,
+                        help='Disable Nagle\'s algorithm on tcp, so small packets are sent straight away (default: on)')
+parser.add_argument('--negotiate', action='store_true',
+                        help='Agree the RDT version, packet size and compression with the other end in a handshake')
+parser.add_argument('--fallback', nargs='*', default=[], choices=['1.0', '2.0', '2.1', '2.2', '3.0'],
+                        help='With --negotiate, other RDT versions to offer after rdt_ver')
 parser.add_argument('--error_prob', default=0.0, type=float,
                         help='Probability of specified number of bit errors occuring in a message (default: 0.0)')
 parser.add_argument('--error_num', default=1, type=int,
                         help='Number of random bit errors per message (default: 1)')
 parser.add_argument('--burst', default=0, type=int,
                         help='Length of random burst error in every message (default: 0)')
+parser.add_argument('--compress', choices=['none'] + list(CODECS), default='none',
+                        help='Compress outgoing messages with this codec (default: none)')
+parser.add_argument('--compress_level', default=None, type=int,
+                        help='Compression level for the chosen codec (default: codec default)')
+parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='Profile the run into this file, and print the time spent in each RDT state on exit')
+parser.add_argument('--profiler', choices=profiling.PROFILERS, default='cprofile',
+                        help='With --profile, cprofile writes a pstats file, sample writes collapsed stacks (default: %(default)s)')
+parser.add_argument('--send-file', dest='send_file', default=None, metavar='PATH',
+                        help='Send this file to the server (which needs --recv-dir), print the rate and exit')
 args = parser.parse_args()
+if args.send_file is not None and not os.path.isfile(args.send_file):
+    parser.error(f"--send-file: no such file: {args.send_file}")
+if args.send_file is not None and args.rdt_ver == '1.0' and args.sock_type in LOSSY_SOCK_TYPES and not args.fallback:
+    parser.error(f"--send-file: RDT 1.0 can't resend lost packets, so use 2.0 or later over {args.sock_type}")
+# the unix socket types are addressed by a path rather than an IP
+address = args.path if args.sock_type.startswith('unix') else args.ip
+if args.profile is not None:
+    profiling.start(args.profile, args.profiler)
+
+compressor = Compressor(args.compress, args.compress_level) if args.compress != 'none' else None
+socket_options = SocketOptions(args.port, args.rcvbuf, args.sndbuf, args.nodelay)
 
 try:
-    m = messenger.ClientMessenger(sock_type=args.sock_type, ip=args.ip, rdt=RDTFactory.create(args.rdt_ver, 
-                                                                                                    args.error_prob, args.error_num, args.burst))
+    m = messenger.ClientMessenger(sock_type=args.sock_type, ip=address, rdt=RDTFactory.create(args.rdt_ver, 
+                                                                                                    args.error_prob, args.error_num, args.burst),
+                                  compressor=compressor, socket_options=socket_options,
+                                  negotiate=args.negotiate, versions=[args.rdt_ver] + args.fallback)
 
     print("\033[35mSuccessfully started " + m.sock_type + " client\033[0m")
 
+    if args.send_file is not None:
+        try:
+            size, seconds = send_file(m, args.send_file)
+        except ValueError as e:
+            # eg the handshake settled on RDT 1.0 over udp
+            print("\033[35mCouldn't send the file: " + str(e) + "\033[0m")
+            m.finish()
+            sys.exit(1)
+        print(f"\033[35mSent {size} bytes in {seconds:.2f}s ({rate(size, seconds)})\033[0m")
+        m.finish()
+        sys.exit(0)
+
     # exchange messages on this connection
     while True:
         data = input("\033[35mprompt>\033[0m")
 
         if data == 'close':
-            m.finish()
+            break
         else:
             print("\033[35mSending...\033[0m")
-            m.send(data)
+            m.send_text(data)
             print("\033[35mWaiting to receive...\033[0m")
-            r = m.receive()
+            r = m.receive_text()
 
             print("\033[35mReceived [[" + r + "]]\033[0m")
 
     # todo handle timeout
     m.finish()
 
+except (ConnectionRefusedError, FileNotFoundError):
+    print("Failed to start. Is the server running?")
+    sys.exit(1)
+
+except ClosedSocketError:
+    print("The server closed the connection")
+    sys.exit(1)
+
+except HandshakeError as e:
+    print("Handshake failed: " + str(e))
+    sys.exit(1)
+
 except KeyboardInterrupt:
     m.finish()
@@ -6,53 +6,158 @@ This should start before the client so a binding is created
 """
 
 from datetime import datetime
+import os
 import sys
 import argparse
+from typing import Union
 
 import messenger
+import profiling
 from rdt_protocol import RDTFactory
+from compression import Compressor, CODECS
+from transport import GenericSocket, SocketOptions, UnixSocketMixin, ClosedSocketError
+from handshake import HandshakeError
+from file_transfer import FILE_PREFIX, TransferError, receive_file, rate
 
 parser = argparse.ArgumentParser(
     description="""This script runs the server side of the communications. This should start before the client so a binding is created.""")
 parser.add_argument('rdt_ver', choices=['1.0', '2.0', '2.1', '2.2', '3.0'],
                         help='RDT version (choose from: 1.0, 2.0, 2.1, 2.2, 3.0)')
-parser.add_argument('--sock_type', choices=['udp', 'tcp'], default='udp',
-                        help='Socket type (choose from: udp, tcp, default: udp)')
+parser.add_argument('--sock_type', choices=['udp', 'tcp', 'unix', 'unix-dgram'], default='udp',
+                        help='Socket type (choose from: udp, tcp, unix, unix-dgram, default: udp)')
 parser.add_argument('--ip', default='localhost',
                         help='IP address (default: localhost)')
+parser.add_argument('--path', default=UnixSocketMixin.DEFAULT_PATH,
+                        help='Socket file for the unix socket types (default: %(default)s)')
+parser.add_argument('--port', default=GenericSocket.DEFAULT_PORT, type=int,
+                        help='Port for the udp and tcp socket types (default: %(default)s)')
+parser.add_argument('--rcvbuf', default=None, type=int,
+                        help='Socket receive buffer size in bytes (default: OS default)')
+parser.add_argument('--sndbuf', default=None, type=int,
+                        help='Socket send buffer size in bytes (default: OS default)')
+parser.add_argument('--nodelay', default=True, action=argparse.BooleanOptionalAction,
+                        help='Disable Nagle\'s algorithm on tcp, so small packets are sent straight away (default: on)')
+parser.add_argument('--reuseport', action='store_true',
+                        help='Set SO_REUSEPORT, so several servers can share the port (default: off)')
+parser.add_argument('--negotiate', action='store_true',
+                        help='Agree the RDT version, packet size and compression with the other end in a handshake')
+parser.add_argument('--fallback', nargs='*', default=[], choices=['1.0', '2.0', '2.1', '2.2', '3.0'],
+                        help='With --negotiate, other RDT versions to accept')
 parser.add_argument('--error_prob', default=0.0, type=float,
                         help='Probability of specified number of bit errors occuring in a message (default: 0.0)')
 parser.add_argument('--error_num', default=1, type=int,
                         help='Number of random bit errors per message (default: 1)')
 parser.add_argument('--burst', default=0, type=int,
                         help='Length of random burst error in every message (default: 0)')
+parser.add_argument('--compress', choices=['none'] + list(CODECS), default='none',
+                        help='Compress outgoing messages with this codec (default: none)')
+parser.add_argument('--compress_level', default=None, type=int,
+                        help='Compression level for the chosen codec (default: codec default)')
+parser.add_argument('--multi', action='store_true',
+                        help='Serve many clients at once on the one port')
+parser.add_argument('--workers', default=messenger.MessengerServer.DEFAULT_WORKERS, type=int,
+                        help='With --multi, the most clients served at once (default: %(default)s)')
+parser.add_argument('--processes', action='store_true',
+                        help='With --multi, serve clients in worker processes rather than threads (tcp or unix only)')
+parser.add_argument('--handlers', default=messenger.Messenger.HANDLER_WORKERS, type=int,
+                        help='Messages handled at once on each connection (default: %(default)s)')
+parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='Profile the run into this file, and print the time spent in each RDT state on exit')
+parser.add_argument('--profiler', choices=profiling.PROFILERS, default='cprofile',
+                        help='With --profile, cprofile writes a pstats file, sample writes collapsed stacks (default: %(default)s)')
+parser.add_argument('--recv-dir', dest='recv_dir', default=None, metavar='DIR',
+                        help='Save files sent by clients with --send-file in this directory')
 args = parser.parse_args()
+if args.recv_dir is not None and not os.path.isdir(args.recv_dir):
+    parser.error(f"--recv-dir: no such directory: {args.recv_dir}")
+# the unix socket types are addressed by a path rather than an IP
+address = args.path if args.sock_type.startswith('unix') else args.ip
+if args.processes and args.sock_type not in ('tcp', 'unix'):
+    parser.error("--processes is only supported with --sock_type tcp or unix")
+if args.profile is not None:
+    profiling.start(args.profile, args.profiler)
 
-try:
-    # make any number of connections until termination
-    while True:
-        m = messenger.ServerMessenger(sock_type=args.sock_type, ip=args.ip, rdt=RDTFactory.create(args.rdt_ver, 
-                                                                                                    args.error_prob, args.error_num, args.burst))
+compressor = Compressor(args.compress, args.compress_level) if args.compress != 'none' else None
+socket_options = SocketOptions(args.port, args.rcvbuf, args.sndbuf, args.nodelay, args.reuseport)
 
-        print("\033[35mSuccessfully started " + m.sock_type + " server\033[0m")
+def respond(d: bytes) -> Union[None, bytes]:
+    """the server's response to a message, or None to drop it"""
+    print("\033[35mReceived <<" + d.decode(errors='replace') + ">>\033[0m")
+    if d == b'drop':
+        # drop this message
+        return None
+    # actual ack should be handled in the layers below, this is just the server response
+    print("\033[35mSending...\033[0m")
+    return b'<<' + d + b'>> rec\'d at ' + str(datetime.now()).encode()
 
-        # exchange messages on this connection
-        while True:
-            print("\033[35mWaiting to receive...\033[0m")
-            d = m.receive()
-            print("\033[35mReceived <<" + d + ">>\033[0m")
-            if d == "FINMSG" or d == "":
-                print("\033[35mClosing because of receipt <<"+d+">>\033[0m")
+def serve(m: messenger.Messenger):
+    """exchange messages on this connection"""
+    if args.recv_dir is None:
+        # messages are handled on a worker pool, so more can be received while one is being answered
+        print("\033[35mWaiting to receive...\033[0m")
+        m.serve(respond, workers=args.handlers)
+        print("\033[35mClosing because the client finished\033[0m")
+        return
+
+    # file transfers are received straight from the connection, so messages are handled in turn
+    while True:
+        print("\033[35mWaiting to receive...\033[0m")
+        d = m.receive()
+        text = d.decode(errors='replace')
+        if d == b"FINMSG" or d == b"":
+            print("\033[35mClosing because of receipt <<"+text+">>\033[0m")
+            m.finish()
+            break
+        elif d.startswith(FILE_PREFIX):
+            try:
+                path, size, seconds = receive_file(m, d, args.recv_dir)
+            except TransferError as e:
+                # the connection can't be trusted to be in step any more
+                print("\033[35mFile transfer failed: " + str(e) + "\033[0m")
                 m.finish()
                 break
-            elif d == 'drop':
-                # drop this message
-                pass
-            # actual ack should be handled in the layers below, this is just the server response
-            else:
-                print("\033[35mSending...\033[0m")
-                m.send('<<' + d + '>> rec\'d at ' + str(datetime.now()))
-        # todo handle timeout
-
-except KeyboardInterrupt:
-    m.finish()
+            print(f"\033[35mReceived {size} bytes into {path} in {seconds:.2f}s ({rate(size, seconds)})\033[0m")
+        else:
+            response = respond(d)
+            if response is not None:
+                m.send(response)
+    # todo handle timeout
+
+if args.multi:
+    server = messenger.MessengerServer(args.sock_type, address,
+                                       lambda: RDTFactory.create(args.rdt_ver, args.error_prob, args.error_num, args.burst),
+                                       serve, workers=args.workers, processes=args.processes,
+                                       compressor=compressor, socket_options=socket_options,
+                                       negotiate=args.negotiate, versions=[args.rdt_ver] + args.fallback)
+    print("\033[35mSuccessfully started " + args.sock_type + " server for multiple clients\033[0m")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+else:
+    try:
+        # make any number of connections until termination
+        while True:
+            m = messenger.ServerMessenger(sock_type=args.sock_type, ip=address, rdt=RDTFactory.create(args.rdt_ver, 
+                                                                                                        args.error_prob, args.error_num, args.burst),
+                                          compressor=compressor, socket_options=socket_options,
+                                          negotiate=args.negotiate, versions=[args.rdt_ver] + args.fallback)
+
+            print("\033[35mSuccessfully started " + m.sock_type + " server\033[0m")
+            try:
+                serve(m)
+            except HandshakeError as e:
+                print("\033[35mHandshake failed: " + str(e) + "\033[0m")
+                m.transport.close()
+                if m.mux is not None:
+                    m.mux.close()
+            except (ClosedSocketError, OSError) as e:
+                # one client going away shouldn't stop the server taking the next
+                print("\033[35mConnection lost: " + (str(e) or type(e).__name__) + "\033[0m")
+                if not m.transport.closed:
+                    m.transport.close()
+                if m.mux is not None:
+                    m.mux.close()
+
+    except KeyboardInterrupt:
+        m.finish()
@@ -0,0 +1,173 @@
+"""
+Several independent message streams over one connection.
+
+A StreamMux takes over a connected transport and hands out a StreamSocket per
+stream, which is used like any other socket. Each stream runs its own RDT
+strategy, which tags its packets with the stream's id (the `I:` header field),
+so every stream's packets, ACKs and re-sends are sequenced on their own. A
+thread reads each packet off the transport and queues it for its stream, so a
+slow or error-heavy transfer on one stream doesn't hold up the others.
+
+Stream 0 is the connection's own, and carries the untagged packets. Streams
+opened by the end that started the connection get odd ids, and those opened
+by the other end get even ids, so the two ends never pick the same one.
+"""
+
+import queue
+import threading
+from collections import deque
+from typing import Union
+
+from transport import GenericSocket, UDPSession, ClosedSocketError
+from rdt_protocol import RDTProtocolStrategy
+
+
+class StreamSocket(GenericSocket):
+    """One stream of a StreamMux. Created by the mux, not the user"""
+    def __init__(self, mux: 'StreamMux', stream_id: int):
+        # shares the mux's transport rather than opening a socket of its own
+        self.mux = mux
+        self.stream_id = stream_id
+        self.binding = mux.transport.binding
+        self.pending: deque[Union[None, memoryview]] = deque()
+        self.ready = threading.Condition()
+        self.opened = True
+        self.closed = False
+
+    def send(self, data: bytes):
+        if self.closed:
+            raise ClosedSocketError()
+        self.mux.send(data)
+
+    def send_many(self, packets: list[tuple[bytes, ...]]):
+        if self.closed:
+            raise ClosedSocketError()
+        self.mux.send_many(packets)
+
+    # packets are queued for us by the mux, and taken off the queue, just as datagrams are for a UDPSession
+    _datagram_received = UDPSession._datagram_received
+    receive_view = UDPSession.receive_view
+    receive_many = UDPSession.receive_many
+    wait_readable = UDPSession.wait_readable
+
+    def release(self, view: memoryview):
+        # the mux queues copies of the packets, so there's no buffer to give back
+        pass
+
+    def close(self):
+        """Close the stream. The connection stays open for the other streams"""
+        if self.closed:
+            raise ClosedSocketError()
+        self.closed = True
+        self.mux._remove_stream(self)
+
+
+class StreamMux():
+    """
+    Carries several streams over one connected transport. `initiator` is True
+    on the end that started the connection, and decides which ids we open
+    streams with. Both ends of the connection must use one
+    """
+
+    """How often (in seconds) the router checks whether the mux has been closed"""
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, transport: GenericSocket, initiator: bool):
+        self.transport = transport
+        self.closed = False
+        self.streams: dict[int, StreamSocket] = {0: StreamSocket(self, 0)}
+        # streams closed at this end, so late packets for them aren't taken for new streams
+        self.finished: set[int] = set()
+        self.lock = threading.Lock()
+        # packets from different streams mustn't be interleaved part way through a send
+        self.send_lock = threading.Lock()
+        self.new_streams: queue.Queue[Union[None, StreamSocket]] = queue.Queue()
+        self.next_id = 1 if initiator else 2
+
+        self.router = threading.Thread(target=self._route, daemon=True)
+        self.router.start()
+
+    def open(self) -> StreamSocket:
+        """Open a new stream"""
+        with self.lock:
+            if self.closed:
+                raise ClosedSocketError()
+            stream = StreamSocket(self, self.next_id)
+            self.streams[stream.stream_id] = stream
+            self.next_id += 2
+        return stream
+
+    def accept(self) -> StreamSocket:
+        """Wait for the other end to open a stream, and return it"""
+        stream = self.new_streams.get()
+        if stream is None:
+            raise ClosedSocketError()
+        return stream
+
+    def send(self, data: bytes):
+        with self.send_lock:
+            self.transport.send(data)
+
+    def send_many(self, packets: list[tuple[bytes, ...]]):
+        with self.send_lock:
+            self.transport.send_many(packets)
+
+    def _route(self):
+        """Hand each packet received to its stream, until we're closed or the connection is"""
+        try:
+            while not self.closed:
+                if not self.transport.wait_readable(self.POLL_INTERVAL):
+                    continue
+                views = self.transport.receive_many(RDTProtocolStrategy.RECV_BATCH_LEN)
+                # copied, as the views are only valid until the transport's next receive
+                packets = [bytes(view) for view in views]
+                for view in views:
+                    self.transport.release(view)
+                if self.transport.closed:
+                    # a stream socket whose peer has hung up
+                    break
+                for packet in packets:
+                    self._deliver(packet)
+        except (ClosedSocketError, OSError, ValueError):
+            # the transport was closed under us
+            pass
+
+        # wake up anyone still waiting on a stream or on accept()
+        with self.lock:
+            self.closed = True
+            for stream in self.streams.values():
+                stream._datagram_received(None)
+            self.streams.clear()
+        self.new_streams.put(None)
+
+    def _deliver(self, packet: bytes):
+        """Queue a packet for its stream, starting a new stream if the other end has opened one"""
+        try:
+            stream_id = RDTProtocolStrategy.stream_of(packet)
+        except ValueError:
+            # not a packet we can make sense of
+            return
+        with self.lock:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                if stream_id in self.finished or stream_id % 2 == self.next_id % 2:
+                    # a late packet for a stream we've closed, or for one of our ids we never opened
+                    return
+                stream = StreamSocket(self, stream_id)
+                self.streams[stream_id] = stream
+                self.new_streams.put(stream)
+        stream._datagram_received(memoryview(packet))
+
+    def _remove_stream(self, stream: StreamSocket):
+        with self.lock:
+            if self.streams.get(stream.stream_id) is stream:
+                del self.streams[stream.stream_id]
+                self.finished.add(stream.stream_id)
+
+    def close(self):
+        """Stop routing packets, and close the transport"""
+        self.closed = True
+        if threading.current_thread() is not self.router:
+            self.router.join()
+        if not self.transport.closed:
+            self.transport.close()
@@ -0,0 +1,175 @@
+"""
+Parallel, resumable sweep of the sampled error detection rates.
+
+checksum_performance_test.py and parity_check2D_performance_testing.py
+corrupt a message NUM_SAMPLES times for each error count or burst length in
+turn, in one process, printing as they go. This runs the same trials over a
+grid of:
+    codec x message x error pattern (k random bit errors, or a burst of L bits) x samples
+
+Each cell of the grid is run in a process pool. A cell's random stream is
+seeded from rdt_functionality.SEED and the cell itself, so its result doesn't
+depend on which worker runs it, in what order, or what else is in the grid.
+Each finished cell is appended to a cache file straight away, and cells
+already in it are skipped, so an interrupted sweep carries on where it left off.
+The results are printed as a table, and can be written as CSV and JSON.
+
+    python3 sweep.py --errors 1 2 3 4 --bursts 4 8 16 --samples 1000 10000 --csv sweep.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import rdt_functionality
+from rdt_functionality import corrupt, burstError, FAIL
+from report import print_results, load_cache, open_cache, add_to_cache
+
+"""Codecs the trials can be run on"""
+CODECS = ('udp_checksum', 'parity_2d')
+"""Default messages, the ones the sampling scripts corrupt"""
+DEFAULT_MESSAGES = ["Hello, World! This is a test of the performance of checksum. :)",
+                    "This is a test of the performance of an error correcting code. :)"]
+"""Default cache file. Each line is one finished cell"""
+DEFAULT_CACHE = os.path.join('.cache', 'sweep.jsonl')
+"""Bumped when the way cells are run changes, so old cached results aren't used"""
+CACHE_VERSION = 1
+"""Fields of each result, in the order they're written to CSV"""
+FIELDS = ["codec", "message", "length", "pattern", "samples", "seed",
+          "detected", "corrected", "detected_pct", "corrected_pct", "seconds"]
+"""Columns of the printed table, as (name, key, format)"""
+TABLE_COLUMNS = [("codec", "codec", "{}"), ("length", "length", "{}"), ("pattern", "pattern", "{}"),
+                 ("samples", "samples", "{}"), ("detected %", "detected_pct", "{:.3f}"),
+                 ("corrected %", "corrected_pct", "{:.3f}")]
+
+
+def grid(codecs: list[str], messages: list[str], errors: list[int], bursts: list[int],
+         samples: list[int], seed: int) -> list[dict]:
+    """Every cell of the sweep"""
+    patterns = [f"bits:{k}" for k in errors] + [f"burst:{length}" for length in bursts]
+    return [{"codec": codec, "message": message, "pattern": pattern, "samples": n, "seed": seed}
+            for codec in codecs for message in messages for pattern in patterns for n in samples]
+
+def cell_key(cell: dict) -> str:
+    """What a cell is cached under"""
+    digest = hashlib.sha256(cell["message"].encode('utf-8')).hexdigest()[:16]
+    return f"v{CACHE_VERSION}:{cell['codec']}:{digest}:{cell['pattern']}:{cell['samples']}:{cell['seed']}"
+
+def cell_seed(cell: dict) -> int:
+    """
+    The seed of a cell's random stream. numpy's SeedSequence mixes the sweep's
+    seed with the cell's key, so each cell gets a stream independent of the others
+    """
+    key = hashlib.sha256(cell_key(cell).encode()).digest()
+    words = [int.from_bytes(key[i:i+4], 'little') for i in range(0, len(key), 4)]
+    state = np.random.SeedSequence(cell["seed"], spawn_key=words).generate_state(2, dtype=np.uint64)
+    return int(state[0]) << 64 | int(state[1])
+
+
+def run_cell(cell: dict) -> dict:
+    """
+    Corrupt the cell's message `samples` times, as the sampling scripts do, and
+    count how many corrupt messages its codec detects (and, for 2D parity, corrects)
+    """
+    # corrupt() and burstError() draw from the random module, and each worker runs one cell at a time
+    random.seed(cell_seed(cell))
+    message = cell["message"].encode('utf-8')
+    kind, amount = cell["pattern"].split(':')
+    amount = int(amount)
+    detected = corrected = 0
+    start = time.perf_counter()
+    if cell["codec"] == 'udp_checksum':
+        check = rdt_functionality.generateUDPChecksum(message)
+    else:
+        check = rdt_functionality.generate2DParityCheck(message)
+    for _ in range(cell["samples"]):
+        corrupted = corrupt(message, amount) if kind == 'bits' else burstError(message, amount)
+        if cell["codec"] == 'udp_checksum':
+            detected += rdt_functionality.verifyUDPChecksum(corrupted, check) == 1
+        else:
+            fixed, verification = rdt_functionality.verify2DParityCheck(corrupted, check)
+            if verification == FAIL:
+                detected += 1
+            elif fixed == message:
+                detected += 1
+                corrected += 1
+    return dict(cell, length=len(message), detected=detected, corrected=corrected,
+                detected_pct=detected / cell["samples"] * 100, corrected_pct=corrected / cell["samples"] * 100,
+                seconds=time.perf_counter() - start)
+
+
+def sweep(cells: list[dict], workers: int, cache_path: str = None) -> list[dict]:
+    """Run every cell that isn't cached, returning the results of all of them in grid order"""
+    done = load_cache(cache_path) if cache_path is not None else {}
+    pending = [cell for cell in cells if cell_key(cell) not in done]
+    print(f"{len(cells) - len(pending)} of {len(cells)} cells cached, running {len(pending)}", file=sys.stderr)
+    if pending:
+        cache = open_cache(cache_path) if cache_path is not None else None
+        try:
+            with multiprocessing.Pool(workers) as pool:
+                for i, result in enumerate(pool.imap_unordered(run_cell, pending), 1):
+                    key = cell_key(result)
+                    done[key] = result
+                    if cache is not None:
+                        add_to_cache(cache, key, result)
+                    print(f"{i} of {len(pending)} cells done: {result['codec']} {result['pattern']} "
+                          f"x{result['samples']} in {result['seconds']:.1f}s", file=sys.stderr)
+        finally:
+            if cache is not None:
+                cache.close()
+    return [done[cell_key(cell)] for cell in cells]
+
+
+def write_csv(path: str, results: list[dict]):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the sampled error detection rates over a grid, in parallel")
+    parser.add_argument('--codecs', nargs='+', default=list(CODECS), choices=CODECS,
+                        help='Checks to run (default: all)')
+    parser.add_argument('--messages', nargs='+', default=DEFAULT_MESSAGES,
+                        help='Messages to corrupt (default: the sampling scripts\' samples)')
+    parser.add_argument('--errors', nargs='*', type=int, default=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 16],
+                        help='Numbers of random bit errors (default: %(default)s)')
+    parser.add_argument('--bursts', nargs='*', type=int, default=list(range(2, 18)),
+                        help='Burst error lengths (default: 2 to 17)')
+    parser.add_argument('--samples', nargs='+', type=int, default=[10**4],
+                        help='Corrupt messages per cell (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=rdt_functionality.SEED,
+                        help='Seed the cells\' random streams are derived from (default: rdt_functionality.SEED)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: one per CPU)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, metavar='PATH',
+                        help='File finished cells are kept in (default: %(default)s)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Run every cell, and don\'t keep the results')
+    parser.add_argument('--csv', default=None, metavar='PATH',
+                        help='Also write the results to this CSV file')
+    parser.add_argument('--json', default=None, metavar='PATH',
+                        help='Also write the results to this JSON file')
+    args = parser.parse_args()
+    if any(n < 1 for n in args.errors + args.bursts + args.samples):
+        parser.error("error counts, burst lengths and sample counts must be at least 1")
+
+    cells = grid(args.codecs, args.messages, args.errors, args.bursts, args.samples, args.seed)
+    results = sweep(cells, args.workers, args.cache if args.use_cache else None)
+    print_results(results, TABLE_COLUMNS)
+
+    if args.csv is not None:
+        write_csv(args.csv, results)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({"seed": args.seed, "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       "results": [{field: r[field] for field in FIELDS} for r in results]}, f, indent=2)
@@ -8,14 +8,60 @@ managed through the subclasses:
     - ClientUDPSocket
     - ServerUDPSocket
 
+For client and server on the same host, the same classes are available over
+AF_UNIX sockets, addressed by a filesystem path instead of an IP:
+    - ClientUnixSocket, ServerUnixSocket (stream, like TCP)
+    - ClientUnixDgramSocket, ServerUnixDgramSocket (datagram, like UDP)
+
 GenericSocket, TCPSocket, and UDPSocket are abstract classes, and shouldn't be
 used directly by the user
+
+A ServerUDPSocket can also serve many clients at once. Calling accept() on it
+starts demultiplexing the datagrams it receives by the sender's (ip, port), and
+returns a UDPSession per client, which is used like any other socket. Likewise
+a ServerTCPSocket made with wait_for_client=False keeps its listening socket,
+and its accept() returns a TCPConnection per client
+
+Received packets are read into buffers from a BufferPool with recv_into, rather
+than into a new bytes object each time. receive_view() hands up a memoryview of
+the buffer, which goes back to the pool with release() once it has been used.
+receive() does both, returning a copy of the data
+
+receive_many() and send_many() move several packets per call. On UDP,
+receive_many() drains every datagram already waiting without blocking, and
+send_many() gathers each packet's parts with sendmsg rather than joining them
+
+TCP sockets frame each packet with a length prefix (the same framing as the
+async TCP sockets), so one receive always returns exactly one packet
+
+A Reactor waits on many sockets and timers at once from one thread, sleeping
+in a selector (epoll on Linux) until something is ready. The server sockets use
+one to wait for new clients without polling
 """
 
+import heapq
+import os
+import queue
+import select
+import selectors
 import socket
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Callable
+from typing import Union
+
+# sendmsg and MSG_DONTWAIT aren't available everywhere (eg Windows), so batched I/O falls back without them
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+HAS_DONTWAIT = hasattr(socket, 'MSG_DONTWAIT')
+DONTWAIT = socket.MSG_DONTWAIT if HAS_DONTWAIT else 0
+HAS_POLL = hasattr(select, 'poll')
 
 class SocketFactory():
-    """Generator factory for one of the four socket types, being the mix of 'client'/'server' and 'tcp'/'udp'"""
+    """Generator factory for one of the socket types, being the mix of 'client'/'server' and 'tcp'/'udp'/'unix'/'unix-dgram'"""
     @staticmethod
     def new_socket(client_server: str, sock_type: str):
         if sock_type == 'tcp':
@@ -30,8 +76,195 @@ class SocketFactory():
             if client_server == 'server':
                 return ServerUDPSocket
             raise ValueError("Invalid client/server type")
+        elif sock_type == 'unix':
+            if client_server == 'client':
+                return ClientUnixSocket
+            if client_server == 'server':
+                return ServerUnixSocket
+            raise ValueError("Invalid client/server type")
+        elif sock_type == 'unix-dgram':
+            if client_server == 'client':
+                return ClientUnixDgramSocket
+            if client_server == 'server':
+                return ServerUnixDgramSocket
+            raise ValueError("Invalid client/server type")
         raise ValueError("Invalid socket type")
 
+class BufferPool():
+    """
+    Reusable fixed-size receive buffers. acquire() hands out a free buffer,
+    only allocating a new one if they're all in use, and release() returns it
+    """
+
+    """Number of buffers allocated up front"""
+    DEFAULT_BUFFERS = 4
+
+    def __init__(self, buffer_size: int, n_buffers: int = DEFAULT_BUFFERS):
+        self.buffer_size = buffer_size
+        self.free: deque[bytearray] = deque(bytearray(buffer_size) for _ in range(n_buffers))
+
+    def acquire(self) -> bytearray:
+        try:
+            return self.free.pop()
+        except IndexError:
+            # everything is in use, so grow the pool
+            return bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray):
+        self.free.append(buffer)
+
+
+class Timer():
+    """A callback scheduled by Reactor.call_later()"""
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the callback from running, if it hasn't already"""
+        self.cancelled = True
+
+    def __lt__(self, other: 'Timer') -> bool:
+        return self.when < other.when
+
+
+class Reactor():
+    """
+    Waits on many sockets and timers from a single thread. Sockets are registered
+    with a callback to run when they become readable or writable, and call_later()
+    schedules a callback after a delay. run() sleeps in the selector until the next
+    socket or timer is ready, so there's no polling. wake() and stop() can be
+    called from other threads
+    """
+
+    """Bytes of wake up signals read in one go"""
+    WAKE_BUFFLEN = 64
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers: list[Timer] = []   # a heap, soonest first
+        self.timers_lock = threading.Lock()
+        self.stopped = False
+        self.loop_thread: Union[None, int] = None
+
+        # writing to this pair of sockets wakes the selector up from another thread
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ, self._drain_wakeups)
+
+    def register(self, sock: socket.socket, events: int, callback: Callable[[socket.socket, int], None]):
+        """Call `callback(sock, events)` whenever `sock` is ready for `events` (selectors.EVENT_READ/EVENT_WRITE)"""
+        self.selector.register(sock, events, callback)
+
+    def modify(self, sock: socket.socket, events: int, callback: Callable[[socket.socket, int], None]):
+        """Change the events or callback for a registered socket"""
+        self.selector.modify(sock, events, callback)
+
+    def unregister(self, sock: socket.socket):
+        self.selector.unregister(sock)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        """Call `callback(*args)` after `delay` seconds. Returns a Timer that can be cancelled"""
+        timer = Timer(time.monotonic() + delay, callback, args)
+        with self.timers_lock:
+            heapq.heappush(self.timers, timer)
+        # the loop only needs waking if it might be asleep with a later deadline
+        if threading.get_ident() != self.loop_thread:
+            self.wake()
+        return timer
+
+    def run_once(self, timeout: Union[None, float] = None):
+        """Wait until a socket is ready or a timer is due (or `timeout` passes), and run their callbacks"""
+        with self.timers_lock:
+            while self.timers and self.timers[0].cancelled:
+                heapq.heappop(self.timers)
+            if self.timers:
+                delay = max(0, self.timers[0].when - time.monotonic())
+                timeout = delay if timeout is None else min(timeout, delay)
+
+        for key, events in self.selector.select(timeout):
+            key.data(key.fileobj, events)
+
+        now = time.monotonic()
+        due = []
+        with self.timers_lock:
+            while self.timers and self.timers[0].when <= now:
+                timer = heapq.heappop(self.timers)
+                if not timer.cancelled:
+                    due.append(timer)
+        for timer in due:
+            timer.callback(*timer.args)
+
+    def run(self, until: Union[None, Callable[[], bool]] = None):
+        """Run callbacks until stop() is called, or until `until()` returns True"""
+        self.loop_thread = threading.get_ident()
+        try:
+            while not self.stopped and not (until is not None and until()):
+                self.run_once()
+        finally:
+            self.loop_thread = None
+
+    def wake(self):
+        """Make the selector return early, eg because there is a new timer or we're stopping"""
+        try:
+            self.wake_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # either a wake up is already pending, or we've been closed
+            pass
+
+    def _drain_wakeups(self, sock: socket.socket, events: int):
+        try:
+            while sock.recv(self.WAKE_BUFFLEN):
+                pass
+        except BlockingIOError:
+            pass
+
+    def stop(self):
+        """Make run() return, from any thread"""
+        self.stopped = True
+        self.wake()
+
+    def close(self):
+        self.selector.close()
+        self.wake_recv.close()
+        self.wake_send.close()
+
+
+class SocketOptions():
+    """
+    Tuning for the sockets, passed to their constructors. The port is used by both
+    client and server. rcvbuf/sndbuf set the kernel buffer sizes (None leaves the
+    OS default), nodelay turns off Nagle's algorithm on TCP so small packets like
+    ACKs go straight out, and reuseport lets several server processes bind the
+    same port, with the kernel spreading clients across them
+    """
+    def __init__(self, port: Union[None, int] = None, rcvbuf: Union[None, int] = None,
+                 sndbuf: Union[None, int] = None, nodelay: bool = True, reuseport: bool = False):
+        self.port = GenericSocket.DEFAULT_PORT if port is None else port
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.nodelay = nodelay
+        self.reuseport = reuseport
+
+    def apply(self, sock: socket.socket):
+        """Set the options on a socket, skipping any that don't apply to its type"""
+        if self.rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.sndbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        is_ip = sock.family in (socket.AF_INET, socket.AF_INET6)
+        if is_ip and sock.type == socket.SOCK_STREAM:
+            # set either way, as asyncio turns Nagle's algorithm off on its sockets itself
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.nodelay))
+        if self.reuseport and is_ip:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise ValueError("SO_REUSEPORT isn't supported on this platform")
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
 class GenericSocket(): 
     """Generic socket that handles shared python socket API functions. 
     It presents a simplified API to the higher levels which our protocols can
@@ -46,18 +279,66 @@ class GenericSocket():
     """Size of the default buffer to hold received data"""
     BUFFLEN = 1024
 
-    def __init__(self, addr: str, sock_type: int = socket.SOCK_STREAM):
+    """Address family of the underlying socket"""
+    FAMILY = socket.AF_INET
+
+    def __init__(self, addr: str, sock_type: int = socket.SOCK_STREAM, options: Union[None, SocketOptions] = None):
         self.opened = False # set in the child init!
         self.closed = False
-        self.sock = socket.socket(socket.AF_INET, sock_type)
-        self.binding = (addr, self.DEFAULT_PORT)
+        self.options = SocketOptions() if options is None else options
+        self.sock = socket.socket(self.FAMILY, sock_type)
+        self.options.apply(self.sock)
+        self.binding = self._make_binding(addr)
+        self.pool = BufferPool(self.BUFFLEN)
+
+    def _make_binding(self, addr: str):
+        """The socket address to bind or connect to for `addr`"""
+        return (addr, self.options.port)
+
+    def _bind(self, address=None):
+        """Bind the socket, to our binding unless `address` is given"""
+        self.sock.bind(self.binding if address is None else address)
 
-    def send(self, data: str):
+    def send(self, data: bytes):
         raise NotImplementedError()
 
-    def receive(self) -> str:
+    def receive_view(self) -> memoryview:
+        """Receive data into a pooled buffer. The view must be given back with release() once used"""
         raise NotImplementedError()
 
+    def release(self, view: memoryview):
+        """Return the buffer behind a view from receive_view() to the pool"""
+        self.pool.release(view.obj)
+
+    def receive(self) -> bytes:
+        """Receive data, returning a copy of it so the buffer can go straight back to the pool"""
+        view = self.receive_view()
+        data = bytes(view)
+        self.release(view)
+        return data
+
+    def send_many(self, packets: list[tuple[bytes, ...]]):
+        """Send several packets, each given as the parts to join together"""
+        for parts in packets:
+            self.send(b''.join(parts))
+
+    def receive_many(self, max_n: int) -> list[memoryview]:
+        """
+        Wait for data, then return views of up to `max_n` packets that are ready.
+        Each must be given back with release() once used
+        """
+        return [self.receive_view()]
+
+    def wait_readable(self, timeout: Union[None, float]) -> bool:
+        """Wait up to `timeout` seconds (forever if None) for data to receive. Returns True if there is some"""
+        if not HAS_POLL:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            return bool(readable)
+        # unlike select, poll works with any file descriptor number, however many sockets are open
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+
     def close(self):
         """Close a socket"""
         if not self.opened:
@@ -67,7 +348,10 @@ class GenericSocket():
         self.sock.close()
         print('closing socket')
         self.closed = True
-        exit()
+
+    def healthy(self) -> bool:
+        """True if the socket looks usable for another message, eg before an idle one is reused"""
+        return self.opened and not self.closed
 
     def __del__(self):
         """ensure the socket is closed on garbage collection"""
@@ -77,88 +361,444 @@ class GenericSocket():
 
 
 class TCPSocket(GenericSocket):
-    """Parent class of the TCP Socket connections. Uses the SOCK_STREAM send and receive API"""
-    def __init__(self, addr: str):
-        super().__init__(addr, socket.SOCK_STREAM)
+    """
+    Parent class of the TCP Socket connections. Uses the SOCK_STREAM send and receive API.
+    TCP is a byte stream, so packets sent back to back can arrive merged or split.
+    Each packet is sent with a length prefix, and received data is read ahead into
+    a buffer that whole packets are then sliced out of
+    """
+
+    """Length prefix put before each packet"""
+    FRAME_LEN_FORMAT = '!I'
+    FRAME_LEN_SIZE = struct.calcsize(FRAME_LEN_FORMAT)
+
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, socket.SOCK_STREAM, options)
         self.sock.settimeout(1)
-    
-    def send(self, data: str):
+        self._reset_read_ahead()
+
+    def _reset_read_ahead(self):
+        # received bytes not yet handed up are read_ahead[read_start:read_end]
+        self.read_ahead = bytearray(self.BUFFLEN)
+        self.read_start = 0
+        self.read_end = 0
+
+    def send(self, data: bytes):
         if self.closed:
             raise ClosedSocketError()
-        self.sock.sendall(data.encode())
-    
-    def receive(self) -> str:
-        """Wait for data to be received on the connection.
-        If no data is received, the connection is closed"""
+        self.sock.sendall(struct.pack(self.FRAME_LEN_FORMAT, len(data)) + data)
+
+    def send_many(self, packets: list[tuple[bytes, ...]]):
+        if self.closed:
+            raise ClosedSocketError()
+        # the frames can all go in one write, as the stream doesn't keep them apart anyway
+        frames = []
+        for parts in packets:
+            frames.append(struct.pack(self.FRAME_LEN_FORMAT, sum(len(part) for part in parts)))
+            frames.extend(parts)
+        self.sock.sendall(b''.join(frames))
+
+    def receive_view(self) -> memoryview:
+        """Wait for a whole packet to be received on the connection.
+        If the peer has hung up, the connection is closed and ClosedSocketError raised.
+        The view is of the read ahead buffer, and is only valid until the next receive"""
         # you can receive on a closed socket! -- Maybe have a TX closed and RX closed option?
         # if self.closed:
             # raise ClosedSocketError()
-        data = self.sock.recv(self.BUFFLEN)
-        if not data:
-            self.close()
-        return data.decode()
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                return frame
+            if not self._fill():
+                self.close()
+                raise ClosedSocketError()
+
+    def receive_many(self, max_n: int) -> list[memoryview]:
+        views = [self.receive_view()]
+        # any other whole packets that were read along with it
+        while len(views) < max_n:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            views.append(frame)
+        return views
+
+    def release(self, view: memoryview):
+        # the view is of our read ahead buffer rather than one from the pool
+        pass
+
+    def wait_readable(self, timeout: Union[None, float]) -> bool:
+        # a whole packet may already be sitting in the read ahead buffer
+        if self._has_frame():
+            return True
+        return super().wait_readable(timeout)
+
+    def healthy(self) -> bool:
+        # nothing should arrive on an idle connection, so if it's readable the
+        # peer has hung up (or is out of step with us) and it can't be reused
+        return super().healthy() and not self.wait_readable(0)
+
+    def _has_frame(self) -> bool:
+        """True if there is a whole packet in the read ahead buffer"""
+        available = self.read_end - self.read_start
+        if available < self.FRAME_LEN_SIZE:
+            return False
+        (length,) = struct.unpack_from(self.FRAME_LEN_FORMAT, self.read_ahead, self.read_start)
+        return available >= self.FRAME_LEN_SIZE + length
+
+    def _next_frame(self) -> Union[None, memoryview]:
+        """Slice the next whole packet out of the read ahead buffer, or None if there isn't one yet"""
+        if not self._has_frame():
+            return None
+        (length,) = struct.unpack_from(self.FRAME_LEN_FORMAT, self.read_ahead, self.read_start)
+        start = self.read_start + self.FRAME_LEN_SIZE
+        self.read_start = start + length
+        return memoryview(self.read_ahead)[start:self.read_start]
+
+    def _fill(self) -> bool:
+        """Read more of the stream into the read ahead buffer. Returns False if the peer has closed it"""
+        if self.read_start:
+            # move the partial packet we have to the front, making room after it
+            remaining = self.read_end - self.read_start
+            self.read_ahead[:remaining] = self.read_ahead[self.read_start:self.read_end]
+            self.read_start = 0
+            self.read_end = remaining
+        if self.read_end == len(self.read_ahead):
+            # a packet bigger than the buffer, so it needs a bigger one
+            self.read_ahead = self.read_ahead + bytearray(len(self.read_ahead))
+        nbytes = self.sock.recv_into(memoryview(self.read_ahead)[self.read_end:])
+        self.read_end += nbytes
+        return nbytes > 0
 
 
 class ClientTCPSocket(TCPSocket):
     """Client socket to deal with client-specific TCP socket creation"""
-    def __init__(self, addr: str):
-        super().__init__(addr)
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, options)
         # binding = (addr, self.DEFAULT_PORT)
-        try:
-            self.sock.connect(self.binding)
-        except ConnectionRefusedError:
-            print("Failed to start. Is the server running?")
-            exit(1)
+        # ConnectionRefusedError (or FileNotFoundError for unix) if the server isn't running
+        self.sock.connect(self.binding)
         self.opened = True
 
 class ServerTCPSocket(TCPSocket):
-    """Server socket to deal with server-specific TCP socket creation"""
-    def __init__(self, addr: str):
-        super().__init__(addr)
+    """
+    Server socket to deal with server-specific TCP socket creation.
+    By default this waits for a client and then talks to it. With
+    wait_for_client=False it only listens, and accept() returns a
+    TCPConnection per client, keeping the listening socket for the next
+    """
+    def __init__(self, addr: str, wait_for_client: bool = True, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, options)
         # binding = (addr, self.DEFAULT_PORT)
         # allow the address to be reused when the next socket is created
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind(self.binding)
+        self._bind()
         self.sock.listen()
+        self.listener = self.sock
+
+        # the reactor wakes us when a connection arrives, or when we're closed from another thread
+        self.reactor = Reactor()
+        self.reactor.register(self.listener, selectors.EVENT_READ, self._on_connection)
+        self.connections: deque[tuple[socket.socket, tuple]] = deque()
+
+        if not wait_for_client:
+            self.opened = True
+            return
 
         # block until a connection arrives, then unblock
-        while True:
-            try:
-                conn, info = self.sock.accept()
-            except socket.timeout:
-                pass
-            except:
-                raise
-            else:
-                self.sock = conn
-                print("New connection on", info)
-                self.opened = True
-                return
+        conn, info = self._accept()
+        self.sock = conn
+        print("New connection on", info)
+        self.opened = True
+        # this socket only ever talks to the one client, so stop listening
+        self.reactor.close()
+        self.listener.close()
+
+    def _on_connection(self, listener: socket.socket, events: int):
+        try:
+            self.connections.append(listener.accept())
+        except (BlockingIOError, socket.timeout):
+            # the client gave up before we got to it
+            pass
+
+    def _accept(self) -> tuple[socket.socket, tuple]:
+        """Block until a connection arrives on the listening socket"""
+        self.reactor.run(until=lambda: self.connections)
+        if not self.connections:
+            # run() only returns without a connection when we've been closed
+            self.reactor.close()
+            raise ClosedSocketError()
+        return self.connections.popleft()
+
+    def close(self):
+        if self.sock is self.listener:
+            # stop any accept() that is waiting, which then closes the reactor
+            self.reactor.stop()
+            if self.reactor.loop_thread is None:
+                self.reactor.close()
+        super().close()
+
+    def accept(self) -> 'TCPConnection':
+        """Wait for a client to connect, and return a socket for talking to it"""
+        conn, info = self._accept()
+        print("New connection on", info)
+        return TCPConnection(conn, info, self.options)
+
+
+class TCPConnection(TCPSocket):
+    """A connection accepted by a listening ServerTCPSocket. Created by the server socket, not the user"""
+    def __init__(self, conn: socket.socket, peer: tuple, options: Union[None, SocketOptions] = None):
+        self.options = SocketOptions() if options is None else options
+        self.options.apply(conn)
+        self.sock = conn
+        self.binding = peer
+        self.pool = BufferPool(self.BUFFLEN)
+        self._reset_read_ahead()
+        self.opened = True
+        self.closed = False
+
+    def close(self):
+        """Close the connection. The listening socket stays open for other clients"""
+        if self.closed:
+            raise ClosedSocketError()
+        self.sock.close()
+        self.closed = True
 
 class UDPSocket(GenericSocket):
     """Parent class of the UDP Socket connections. Uses the SOCK_DGRAM send and receive API"""
-    def __init__(self, addr: str):
-        super().__init__(addr, socket.SOCK_DGRAM)
-    def send(self, data: str):
-        self.sock.sendto(data.encode(), self.binding)
-    def receive(self) -> str:
-        received = self.sock.recvfrom(self.BUFFLEN)
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, socket.SOCK_DGRAM, options)
+    def send(self, data: bytes):
+        self.sock.sendto(data, self.binding)
+    def receive_view(self) -> memoryview:
+        buffer = self.pool.acquire()
+        nbytes, sender = self.sock.recvfrom_into(buffer)
         # save the return address, means recipient will reply to initiator
-        self.binding = received[1]
-        return received[0].decode()
+        self.binding = sender
+        return memoryview(buffer)[:nbytes]
+
+    def send_many(self, packets: list[tuple[bytes, ...]]):
+        if not HAS_SENDMSG:
+            return GenericSocket.send_many(self, packets)
+        for parts in packets:
+            # the kernel gathers the parts into one datagram, so they're never joined in Python
+            self.sock.sendmsg(parts, (), 0, self.binding)
+
+    def receive_many(self, max_n: int) -> list[memoryview]:
+        views = [self.receive_view()]
+        # then drain whatever else has already arrived, without blocking
+        while len(views) < max_n and (HAS_DONTWAIT or self.wait_readable(0)):
+            buffer = self.pool.acquire()
+            try:
+                nbytes, sender = self.sock.recvfrom_into(buffer, 0, DONTWAIT)
+            except BlockingIOError:
+                self.pool.release(buffer)
+                break
+            self.binding = sender
+            views.append(memoryview(buffer)[:nbytes])
+        return views
 
 class ClientUDPSocket(UDPSocket):
     """Client socket to deal with client-specific UDP socket creation"""
-    def __init__(self, addr: str):
-        super().__init__(addr)
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, options)
         self.opened = True
 
 class ServerUDPSocket(UDPSocket):
     """Server socket to deal with server-specific UDP socket creation"""
-    def __init__(self, addr: str):
-        super().__init__(addr)
-        self.sock.bind(self.binding)
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, options)
+        self._bind()
+        self.opened = True
+
+        # only used once accept() has been called
+        self.sessions: dict[tuple, UDPSession] = {}
+        self.sessions_lock = threading.Lock()
+        self.new_sessions: queue.Queue[Union[None, UDPSession]] = queue.Queue()
+        self.router: Union[None, threading.Thread] = None
+        self.reactor: Union[None, Reactor] = None
+
+    def accept(self) -> 'UDPSession':
+        """
+        Wait for a datagram from a new client, and return a session for it.
+        The first call starts a thread that hands each datagram to the session for
+        its sender, so receive() shouldn't be called on this socket after that
+        """
+        if self.router is None:
+            self.reactor = Reactor()
+            self.reactor.register(self.sock, selectors.EVENT_READ, self._route_datagrams)
+            self.router = threading.Thread(target=self._route, daemon=True)
+            self.router.start()
+        session = self.new_sessions.get()
+        if session is None:
+            raise ClosedSocketError()
+        return session
+
+    def _route(self):
+        """Run the router's reactor until we're closed"""
+        try:
+            self.reactor.run()
+        except (OSError, ValueError):
+            # the socket was closed under us
+            pass
+        self.reactor.close()
+
+        # wake up anyone still waiting on a session or on accept()
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session._datagram_received(None)
+            self.sessions.clear()
+        self.new_sessions.put(None)
+
+    def _route_datagrams(self, sock: socket.socket, events: int):
+        """Deliver each waiting datagram to the session for its sender, starting a new session if needed"""
+        while True:
+            buffer = self.pool.acquire()
+            try:
+                nbytes, peer = sock.recvfrom_into(buffer, 0, DONTWAIT)
+            except BlockingIOError:
+                self.pool.release(buffer)
+                return
+            with self.sessions_lock:
+                session = self.sessions.get(peer)
+                if session is None:
+                    session = UDPSession(self, peer)
+                    self.sessions[peer] = session
+                    self.new_sessions.put(session)
+            # the session's receive_view() hands this up, and its release() returns it to our pool
+            session._datagram_received(memoryview(buffer)[:nbytes])
+            if not HAS_DONTWAIT:
+                # without MSG_DONTWAIT, go back to the selector rather than risk blocking
+                return
+
+    def close(self):
+        if self.reactor is not None:
+            self.reactor.stop()
+        super().close()
+
+    def _remove_session(self, session: 'UDPSession'):
+        with self.sessions_lock:
+            if self.sessions.get(session.binding) is session:
+                del self.sessions[session.binding]
+
+
+class UDPSession(GenericSocket):
+    """
+    One client's view of a ServerUDPSocket, returned by its accept(). The server
+    socket queues the client's datagrams here, and replies go out from the server's port
+    """
+    def __init__(self, server: ServerUDPSocket, peer: tuple):
+        # shares the server's socket rather than opening one of its own
+        self.server = server
+        self.sock = server.sock
+        self.binding = peer
+        self.pool = server.pool
+        self.pending: deque[Union[None, memoryview]] = deque()
+        self.ready = threading.Condition()
         self.opened = True
+        self.closed = False
+
+    def _datagram_received(self, data: Union[None, memoryview]):
+        """Called by the server socket. None means the server socket has closed"""
+        with self.ready:
+            self.pending.append(data)
+            self.ready.notify()
+
+    def send(self, data: bytes):
+        if self.closed:
+            raise ClosedSocketError()
+        self.sock.sendto(data, self.binding)
+
+    def receive_view(self) -> memoryview:
+        if self.closed:
+            raise ClosedSocketError()
+        with self.ready:
+            self.ready.wait_for(lambda: self.pending)
+            data = self.pending.popleft()
+        if data is None:
+            self.closed = True
+            raise ClosedSocketError()
+        return data
+
+    def wait_readable(self, timeout: Union[None, float]) -> bool:
+        with self.ready:
+            return bool(self.ready.wait_for(lambda: self.pending, timeout))
+
+    def receive_many(self, max_n: int) -> list[memoryview]:
+        views = [self.receive_view()]
+        # anything else already queued for us can be taken without waiting
+        with self.ready:
+            while len(views) < max_n and self.pending and self.pending[0] is not None:
+                views.append(self.pending.popleft())
+        return views
+
+    # replies go out of the server's socket in the same way as a UDPSocket's
+    send_many = UDPSocket.send_many
+
+    def close(self):
+        """Close the session. The server socket stays open for other clients"""
+        if self.closed:
+            raise ClosedSocketError()
+        self.closed = True
+        self.server._remove_session(self)
+        # hand back the buffers of anything we didn't get round to receiving
+        with self.ready:
+            for view in self.pending:
+                if view is not None:
+                    self.release(view)
+            self.pending.clear()
+
+
+class UnixSocketMixin():
+    """
+    Makes one of the socket classes above use an AF_UNIX socket, where `addr` is
+    the path of the server's socket file rather than an IP. Local traffic then
+    skips the IP stack entirely. Put it first in the bases so its methods win
+    """
+
+    """Path for the server socket, if none is given"""
+    DEFAULT_PATH = '/tmp/rdt.sock'
+    FAMILY = socket.AF_UNIX
+
+    def _make_binding(self, addr: str) -> str:
+        return addr
+
+    def _bind(self, address: Union[None, str] = None):
+        path = self.binding if address is None else address
+        # a socket file left behind by an earlier run would make bind fail
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        self.sock.bind(path)
+        self.bound_path = path
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            # the socket file should be tidied up even if closing the socket fails
+            path = getattr(self, 'bound_path', None)
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+                self.bound_path = None
+
+class ClientUnixSocket(UnixSocketMixin, ClientTCPSocket):
+    """Client side of a stream AF_UNIX socket"""
+    pass
+
+class ServerUnixSocket(UnixSocketMixin, ServerTCPSocket):
+    """Server side of a stream AF_UNIX socket"""
+    pass
+
+class ClientUnixDgramSocket(UnixSocketMixin, ClientUDPSocket):
+    """Client side of a datagram AF_UNIX socket"""
+    def __init__(self, addr: str, options: Union[None, SocketOptions] = None):
+        super().__init__(addr, options)
+        # unlike UDP, an unbound unix socket has no return address, so the server couldn't reply
+        self._bind(os.path.join(tempfile.gettempdir(), f"rdt-client-{os.getpid()}-{id(self)}.sock"))
+
+class ServerUnixDgramSocket(UnixSocketMixin, ServerUDPSocket):
+    """Server side of a datagram AF_UNIX socket"""
+    pass
 
 
 class ClosedSocketError(Exception):